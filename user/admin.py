@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
 from django.utils.translation import gettext as _
+from wines.pagination import EstimatedCountPaginator
 from .models import User
 
 
@@ -37,3 +38,6 @@ class UserAdmin(DjangoUserAdmin):
     list_display = ("email", "first_name", "last_name", "is_staff")
     search_fields = ("email", "first_name", "last_name")
     ordering = ("email",)
+    raw_id_fields = ("saved_wines",)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from wine_library.schema import generate_schema_artifacts, schema_fingerprint
+
+
+class Command(BaseCommand):
+    """Django command to pre-generate the OpenAPI schema artifacts."""
+    def handle(self, *args, **options):
+        self.stdout.write(f"Generating schema version {schema_fingerprint()}...")
+        for path in generate_schema_artifacts():
+            self.stdout.write(f"Wrote {path}")
+        self.stdout.write(self.style.SUCCESS("Schema generated!"))
@@ -0,0 +1,35 @@
+import pstats
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from wine_library.profiling import format_stats, profile_dir
+
+
+class Command(BaseCommand):
+    """Django command to report hot paths from sampled request profiles."""
+    def add_arguments(self, parser):
+        parser.add_argument("--view", help="Only report this view (e.g. WineViewSet.list)")
+        parser.add_argument("--sort", default="cumulative")
+        parser.add_argument("--limit", type=int, default=25)
+
+    def handle(self, *args, **options):
+        by_view = defaultdict(list)
+        for path in sorted((profile_dir() / "aggregate").glob("*.prof")):
+            view = path.name.rsplit(".", 2)[0]
+            if options["view"] in (None, view):
+                by_view[view].append(str(path))
+
+        if not by_view:
+            self.stdout.write("No sampled profiles found.")
+            return
+
+        # restrict the report to the project's view modules
+        restriction = "|".join(
+            module.replace(".", "/") + ".py" for module in settings.PROFILING["modules"]
+        )
+        for view, paths in by_view.items():
+            stats = pstats.Stats(*paths)
+            self.stdout.write(self.style.SUCCESS(f"{view} ({stats.total_calls} calls sampled)"))
+            self.stdout.write(format_stats(stats, options["sort"], options["limit"], (restriction,)))
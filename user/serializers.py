@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from wines.models import WineReview
 from wines.serializers import WineListSerializer
 
 User = get_user_model()
@@ -46,3 +47,16 @@ class UserDetailSerializer(BaseUserSerializer):
             "password",
             "saved_wines",
         )
+
+
+class UserReviewSerializer(serializers.ModelSerializer):
+    wine = WineListSerializer(read_only=True)
+
+    class Meta:
+        model = WineReview
+        fields = ("id", "wine", "rating", "comment", "created_at")
+
+    def to_representation(self, instance):
+        # is_saved of the joined wine is annotated on the review
+        instance.wine.is_saved = instance.wine_is_saved
+        return super().to_representation(instance)
@@ -5,6 +5,9 @@ from django.urls import reverse
 from rest_framework_simplejwt.tokens import RefreshToken
 import logging
 
+from wine_library.testing import QueryBudgetMixin
+from wines.models import Wine, WineReview
+
 logger = logging.getLogger("test_logger")
 logger.setLevel(logging.INFO)
 handler = logging.FileHandler("test_results.log", mode='w', encoding='utf-8')
@@ -15,7 +18,7 @@ logger.addHandler(handler)
 
 User = get_user_model()
 
-class UserTests(APITestCase):
+class UserTests(QueryBudgetMixin, APITestCase):
     def setUp(self):
         self.user_data = {
             "email": "test@example.com",
@@ -183,14 +186,40 @@ class UserTests(APITestCase):
 
     def test_get_user_info(self):
         data = self.user_data
+        self.user.saved_wines.add(Wine.objects.create(title="Saved Wine", capacity=0.75))
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token.access_token}")
-        response = self.client.get(reverse("user:manage"))
+        with self.assertQueryBudget("user:manage"):
+            response = self.client.get(reverse("user:manage"))
         logger.info("TEST: test_get_user_info")
         logger.info(f"Request body: {data}")
         logger.info(f"Response status: {response.status_code}")
         logger.info(f"Response body: {response.data}\n")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["email"], self.user.email)
+        self.assertEqual([wine["is_saved"] for wine in response.data["saved_wines"]], [True])
+
+    def test_list_own_reviews_by_cursor(self):
+        other = User.objects.create_user(email="other@example.com", password="OtherPass123")
+        for index in range(5):
+            wine = Wine.objects.create(title=f"Reviewed Wine {index}", capacity=0.75)
+            WineReview.objects.create(wine=wine, user=self.user, rating=index)
+            WineReview.objects.create(wine=wine, user=other, rating=10)
+        self.user.saved_wines.add(wine)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token.access_token}")
+        url = reverse("user:manage_reviews")
+        with self.assertQueryBudget("user:manage_reviews"):
+            first = self.client.get(url, {"page_size": 3})
+        second = self.client.get(first.data["next"])
+        logger.info("TEST: test_list_own_reviews_by_cursor")
+        logger.info(f"Request: GET {url}?page_size=3")
+        logger.info(f"Response status: {first.status_code}")
+        logger.info(f"Response body: {first.data}\n")
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        ratings = [review["rating"] for review in first.data["results"] + second.data["results"]]
+        self.assertEqual(ratings, [4, 3, 2, 1, 0])
+        self.assertEqual(first.data["results"][0]["wine"]["title"], "Reviewed Wine 4")
+        self.assertEqual([review["wine"]["is_saved"] for review in first.data["results"]], [True, False, False])
+        self.assertIsNone(second.data["next"])
 
 # update info
 
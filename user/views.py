@@ -1,9 +1,13 @@
+from django.db.models import Prefetch, Value, prefetch_related_objects
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 
-from user.serializers import UserSerializer, UserDetailSerializer
+from user.serializers import UserSerializer, UserDetailSerializer, UserReviewSerializer
 from user.permissions import CanEditUserPermission
+from wines.models import Wine, WineReview
+from wines.pagination import ReviewHistoryPagination
+from wines.views import saved_by
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -16,4 +20,25 @@ class ManageUserView(generics.RetrieveUpdateAPIView):
     permission_classes = (IsAuthenticated, CanEditUserPermission)
 
     def get_object(self):
-        return self.request.user
+        user = self.request.user
+        # every wine in the list is saved by the user
+        prefetch_related_objects(
+            [user], Prefetch("saved_wines", queryset=Wine.objects.annotate(is_saved=Value(True)))
+        )
+        return user
+
+
+class ManageUserReviewsView(generics.ListAPIView):
+    """The user's reviews, newest first, with a summary of each wine"""
+
+    serializer_class = UserReviewSerializer
+    authentication_classes = (JWTAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    pagination_class = ReviewHistoryPagination
+
+    def get_queryset(self):
+        return (
+            WineReview.objects.filter(user=self.request.user)
+            .select_related("wine")
+            .annotate(wine_is_saved=saved_by(self.request.user, "wine_id"))
+        )
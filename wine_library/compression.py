@@ -0,0 +1,98 @@
+"""Negotiated gzip/brotli compression of API responses.
+
+``CompressionMiddleware`` compresses JSON responses larger than
+``COMPRESSION["min_size"]`` with the best encoding the client accepts.
+Views serving cacheable content can compress it once with ``precompress``
+and attach the result as ``response.precompressed``; the middleware then
+sends the stored bytes instead of compressing again. Brotli is used when the
+``brotli`` package is installed.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def available_encodings():
+    """Supported encodings, most preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(content, encoding, precompressing=False):
+    """Compress at the highest level when the result is stored, faster otherwise."""
+    config = settings.COMPRESSION
+    if encoding == "br":
+        quality = 11 if precompressing else config["brotli_quality"]
+        return brotli.compress(content, quality=quality)
+    return gzip.compress(content, compresslevel=9 if precompressing else config["gzip_level"])
+
+
+def precompress(content):
+    """``{encoding: compressed bytes}`` for every available encoding, for caching."""
+    if len(content) < settings.COMPRESSION["min_size"]:
+        return {}
+    return {encoding: compress(content, encoding, True) for encoding in available_encodings()}
+
+
+def negotiate(accept_encoding):
+    """The preferred available encoding the ``Accept-Encoding`` header allows, or ``None``."""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        match = re.search(r"q=([0-9.]+)", params)
+        try:
+            accepted[name.strip().lower()] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            continue
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def is_compressible(response):
+    content_type = response.get("Content-Type", "").split(";")[0].strip()
+    return (
+        not response.streaming
+        and not response.has_header("Content-Encoding")
+        and content_type in settings.COMPRESSION["content_types"]
+        and len(response.content) >= settings.COMPRESSION["min_size"]
+    )
+
+
+class CompressionMiddleware:
+    """Compress large JSON responses, reusing ``response.precompressed`` when present."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not is_compressible(response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return response
+
+        precompressed = getattr(response, "precompressed", None) or {}
+        compressed = precompressed.get(encoding)
+        if compressed is None:
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        if response.has_header("ETag"):
+            # the compressed body differs byte for byte, so the validator becomes weak
+            response["ETag"] = re.sub(r'^"', 'W/"', response["ETag"])
+        return response
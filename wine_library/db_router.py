@@ -0,0 +1,145 @@
+"""Read-replica routing with read-your-writes consistency.
+
+Safe-method requests read from a healthy replica listed in
+``DATABASE_REPLICAS``, picked once per request so its count, page and
+follow-up queries all see the same snapshot. After a successful write a user is pinned to the
+primary for ``REPLICA_ROUTING["sticky_seconds"]`` so they always see their
+own changes. The pin is kept in the cache shared by every worker
+(``REDIS_URL``), so it holds whichever worker serves the next request.
+Everything outside a request (commands, migrations, tests) uses the primary.
+"""
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+logger = logging.getLogger("wine_library.db_router")
+
+_request_replica = ContextVar("request_replica", default=None)
+
+_health_lock = threading.Lock()
+_healthy_replicas = []
+_checked_at = None
+
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def replica_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(REPLICA_LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def healthy_replicas():
+    """Replicas whose replication lag is within ``max_lag_seconds``.
+
+    Lag is re-checked at most every ``lag_check_interval`` seconds per process.
+    """
+    global _healthy_replicas, _checked_at
+    config = settings.REPLICA_ROUTING
+    if _checked_at is not None and time.monotonic() - _checked_at < config["lag_check_interval"]:
+        return _healthy_replicas
+
+    with _health_lock:
+        if _checked_at is None or time.monotonic() - _checked_at >= config["lag_check_interval"]:
+            healthy = []
+            for alias in settings.DATABASE_REPLICAS:
+                try:
+                    lag = replica_lag(alias)
+                except DatabaseError:
+                    logger.warning("Replica %s unavailable, taken out of rotation", alias)
+                    continue
+                if lag > config["max_lag_seconds"]:
+                    logger.warning("Replica %s lags %.1fs, taken out of rotation", alias, lag)
+                    continue
+                healthy.append(alias)
+            _healthy_replicas = healthy
+            _checked_at = time.monotonic()
+    return _healthy_replicas
+
+
+def pin_key(user_id):
+    return f"primary-pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    cache.set(pin_key(user_id), 1, timeout=settings.REPLICA_ROUTING["sticky_seconds"])
+
+
+def is_pinned(user_id):
+    return user_id is not None and cache.get(pin_key(user_id)) is not None
+
+
+def current_replica():
+    """Alias of the replica the current request reads from, None when it reads from the primary."""
+    return _request_replica.get()
+
+
+def request_user_id(request):
+    """User id from the session or the JWT, without a database lookup."""
+    if request.user.is_authenticated:
+        return request.user.pk
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = header and authentication.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return authentication.get_validated_token(raw_token)[jwt_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _request_replica.get() or "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaRoutingMiddleware:
+    """Send safe-method requests to replicas unless the user recently wrote."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        user_id = request_user_id(request)
+        replica = None
+        if request.method in SAFE_METHODS and not is_pinned(user_id):
+            replicas = healthy_replicas()
+            if replicas:
+                replica = random.choice(replicas)
+        token = _request_replica.set(replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_replica.reset(token)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400 and user_id:
+            pin_to_primary(user_id)
+        return response
@@ -0,0 +1,259 @@
+"""Prometheus-format metrics shared between worker processes.
+
+Every process keeps its own counters and histograms in memory and
+periodically dumps them to ``METRICS_DIR/metrics-<pid>.json``. The
+``/metrics`` view merges the files of all workers, so a single scrape
+through any worker sees the whole deployment. Gauges are summed across
+workers, e.g. requests in flight in the whole deployment. Files of exited
+processes are removed on collection, so their gauges stop counting.
+
+Scrapes need ``Authorization: Bearer <METRICS_TOKEN>``. Without a token
+configured only staff sessions, or anyone when ``DEBUG`` is on, may scrape.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRICS = {
+    "http_requests_total": ("counter", "Requests by view and status code.", None),
+    "http_request_duration_seconds": ("histogram", "Request latency by view.", LATENCY_BUCKETS),
+    "db_queries_per_request": ("histogram", "Database queries per request by view.", QUERY_BUCKETS),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit/miss).", None),
+    "throttle_rejections_total": ("counter", "Requests rejected by throttling.", None),
+    "image_processing_seconds": ("histogram", "Wine image upload processing time.", LATENCY_BUCKETS),
+    "requests_in_flight": ("gauge", "Requests admitted and not finished yet.", None),
+    "admission_in_flight": ("gauge", "Requests running in a view with a concurrency limit.", None),
+    "admission_queue_depth": ("gauge", "Requests waiting for a slot of a view with a concurrency limit.", None),
+    "admission_limit": ("gauge", "Configured concurrency and queue limits by view.", None),
+    "admission_wait_seconds": ("histogram", "Time queued requests waited for a slot.", LATENCY_BUCKETS),
+    "admission_rejections_total": ("counter", "Requests shed by admission control by view and reason.", None),
+    "single_flight_total": ("counter", "Coalesced computations by result (leader, shared or fallback).", None),
+}
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_last_flush = 0.0
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc(name, labels=None, value=1):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+    _maybe_flush()
+
+
+def set_gauge(name, value, labels=None):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+    _maybe_flush()
+
+
+def observe(name, value, labels=None):
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        histogram[0][bisect_left(buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+    _maybe_flush()
+
+
+@contextmanager
+def timer(name, labels=None):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, labels)
+
+
+def view_label(request):
+    """``ViewSet.action`` (or the URL name) of the view that served the request."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    view_class = getattr(match.func, "cls", None) or getattr(match.func, "view_class", None)
+    actions = getattr(match.func, "actions", None)
+    if view_class and actions:
+        return f"{view_class.__name__}.{actions.get(request.method.lower(), request.method.lower())}"
+    if view_class:
+        return f"{view_class.__name__}.{request.method.lower()}"
+    return match.view_name
+
+
+def _snapshot():
+    with _lock:
+        return {
+            "counters": [[name, labels, value] for (name, labels), value in _counters.items()],
+            "gauges": [[name, labels, value] for (name, labels), value in _gauges.items()],
+            "histograms": [
+                [name, labels, [list(buckets), total, count]]
+                for (name, labels), (buckets, total, count) in _histograms.items()
+            ],
+        }
+
+
+def flush():
+    """Write this process' metrics to the shared metrics directory."""
+    with _flush_lock:
+        _flush()
+
+
+def _flush():
+    global _last_flush
+    _last_flush = time.monotonic()
+    if not settings.METRICS_DIR:
+        return
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"metrics-{os.getpid()}.json"
+    tmp_path = directory / f".metrics-{os.getpid()}-{threading.get_ident()}.tmp"
+    tmp_path.write_text(json.dumps(_snapshot()))
+    os.replace(tmp_path, path)
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    # a thread already flushing writes the same snapshot, don't wait for it
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            _flush()
+    finally:
+        _flush_lock.release()
+
+
+def _process_exited(path):
+    try:
+        os.kill(int(path.stem.removeprefix("metrics-")), 0)
+    except ProcessLookupError:
+        return True
+    except (PermissionError, ValueError):
+        pass
+    return False
+
+
+def collect():
+    """Merge the metrics of every worker process."""
+    if settings.METRICS_DIR:
+        flush()
+        snapshots = []
+        for path in Path(settings.METRICS_DIR).glob("metrics-*.json"):
+            if _process_exited(path):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+    else:
+        snapshots = [_snapshot()]
+
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"] + snapshot.get("gauges", []):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, (buckets, total, count) in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def render():
+    counters, histograms = collect()
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type in ("counter", "gauge"):
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        else:
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ["+Inf"], counts):
+                    cumulative += bucket_count
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = constant_time_compare(request.META.get("HTTP_AUTHORIZATION", ""), f"Bearer {token}")
+    else:
+        allowed = settings.DEBUG or request.user.is_staff
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    """Record latency, status codes and query counts for every request.
+
+    Must come before ``RequestTimingMiddleware`` so its stats are complete.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        label = view_label(request)
+
+        inc("http_requests_total", {"view": label, "status": response.status_code})
+        observe("http_request_duration_seconds", time.perf_counter() - started, {"view": label})
+        stats = getattr(request, "stats", None)
+        if stats is not None:
+            observe("db_queries_per_request", stats.queries, {"view": label})
+        # raised by a DRF throttle; admission control counts its own 429s in admission_rejections_total
+        if response.status_code == 429 and getattr(response, "exception", False):
+            inc("throttle_rejections_total", {"view": label})
+        return response
@@ -0,0 +1,222 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from rest_framework.permissions import SAFE_METHODS
+
+from wine_library import metrics
+from wine_library.db_router import request_user_id
+
+logger = logging.getLogger("wine_library.performance")
+
+
+class RequestStats:
+    """Timings collected for a single request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_started = None
+        self.render_time = 0.0
+        self.total_time = 0.0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    @property
+    def app_time(self):
+        """View and serializer time, excluding database and rendering."""
+        return max(0.0, self.total_time - self.db_time - self.render_time)
+
+    def server_timing(self):
+        return ", ".join(
+            (
+                f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries"',
+                f'app;dur={self.app_time * 1000:.2f};desc="view and serializers"',
+                f"render;dur={self.render_time * 1000:.2f}",
+                f"total;dur={self.total_time * 1000:.2f}",
+            )
+        )
+
+
+def get_budget(view_name, method="GET"):
+    budgets = settings.PERFORMANCE_BUDGETS
+    return {**budgets["default"], **budgets.get("views", {}).get(f"{method} {view_name}", {})}
+
+
+class RequestTimingMiddleware:
+    """Count queries and time DB, view and render work for every request.
+
+    The numbers are sent back as a ``Server-Timing`` header and requests
+    exceeding ``PERFORMANCE_BUDGETS`` are logged.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats()
+        request.stats = stats
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats.record_query))
+            response = self.get_response(request)
+
+        stats.total_time = time.perf_counter() - stats.started
+        response["Server-Timing"] = stats.server_timing()
+        self.check_budget(request, stats)
+        return response
+
+    def process_template_response(self, request, response):
+        stats = request.stats
+        stats.render_started = time.perf_counter()
+
+        def render_finished(rendered):
+            stats.render_time = time.perf_counter() - stats.render_started
+
+        response.add_post_render_callback(render_finished)
+        return response
+
+    def check_budget(self, request, stats):
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        budget = get_budget(view_name, request.method)
+        if stats.queries > budget["queries"] or stats.total_time * 1000 > budget["duration_ms"]:
+            logger.warning(
+                "Request over budget: %s %s (%s) queries=%d db=%.1fms total=%.1fms",
+                request.method,
+                request.path,
+                view_name,
+                stats.queries,
+                stats.db_time * 1000,
+                stats.total_time * 1000,
+            )
+
+
+class ConcurrencyLimiter:
+    """At most ``concurrency`` requests of a view at once.
+
+    Up to ``queue`` more wait ``timeout`` seconds for a slot, in arrival order.
+    """
+
+    QUEUE_FULL = "queue_full"
+    TIMEOUT = "timeout"
+
+    def __init__(self, view, concurrency, queue, timeout):
+        self.labels = {"view": view}
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+        metrics.set_gauge("admission_limit", concurrency, {**self.labels, "limit": "concurrency"})
+        metrics.set_gauge("admission_limit", queue, {**self.labels, "limit": "queue"})
+
+    def acquire(self):
+        """Take a slot. Returns ``None`` once admitted, else why the request was refused."""
+        started = time.perf_counter()
+        with self.condition:
+            if self.active >= self.concurrency or self.waiting:
+                if self.waiting >= self.queue:
+                    return self.QUEUE_FULL
+                self.set_waiting(self.waiting + 1)
+                try:
+                    admitted = self.condition.wait_for(lambda: self.active < self.concurrency, self.timeout)
+                finally:
+                    self.set_waiting(self.waiting - 1)
+                metrics.observe("admission_wait_seconds", time.perf_counter() - started, self.labels)
+                if not admitted:
+                    return self.TIMEOUT
+            self.set_active(self.active + 1)
+            return None
+
+    def release(self):
+        with self.condition:
+            self.set_active(self.active - 1)
+            self.condition.notify()
+
+    def set_active(self, value):
+        self.active = value
+        metrics.set_gauge("admission_in_flight", value, self.labels)
+
+    def set_waiting(self, value):
+        self.waiting = value
+        metrics.set_gauge("admission_queue_depth", value, self.labels)
+
+
+class AdmissionControlMiddleware:
+    """Shed load before expensive views pile up and slow down every request.
+
+    Each worker process admits at most ``ADMISSION_CONTROL["max_concurrent"]``
+    requests; the last ``reserved`` slots are kept for priority requests,
+    i.e. writes by an authenticated user (a session or a valid JWT, not just
+    an ``Authorization`` header) and views without a limit of their own.
+    Views listed in ``ADMISSION_CONTROL["views"]`` also get a
+    ``ConcurrencyLimiter``. Refused requests get ``429`` when the view's queue
+    is full and ``503`` when the process is saturated or the wait timed out,
+    both with ``Retry-After``. Limits only matter for threaded workers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = settings.ADMISSION_CONTROL
+        self.limiters = {
+            view: ConcurrencyLimiter(view, **limits) for view, limits in self.config["views"].items()
+        }
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        request.admission_releases = []
+        try:
+            return self.get_response(request)
+        finally:
+            for release in reversed(request.admission_releases):
+                release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = metrics.view_label(request)
+        limiter = self.limiters.get(view)
+        priority = limiter is None or (request.method not in SAFE_METHODS and request_user_id(request) is not None)
+
+        with self.lock:
+            capacity = self.config["max_concurrent"] - (0 if priority else self.config["reserved"])
+            if self.in_flight >= capacity:
+                return self.reject(view, "overloaded")
+            self.set_in_flight(self.in_flight + 1)
+        request.admission_releases.append(self.leave)
+
+        if limiter is not None:
+            refused = limiter.acquire()
+            if refused:
+                return self.reject(view, refused)
+            request.admission_releases.append(limiter.release)
+        return None
+
+    def leave(self):
+        with self.lock:
+            self.set_in_flight(self.in_flight - 1)
+
+    def set_in_flight(self, value):
+        self.in_flight = value
+        metrics.set_gauge("requests_in_flight", value)
+
+    def reject(self, view, reason):
+        metrics.inc("admission_rejections_total", {"view": view, "reason": reason})
+        if reason == ConcurrencyLimiter.QUEUE_FULL:
+            response = JsonResponse({"detail": "Too many concurrent requests for this endpoint."}, status=429)
+        else:
+            response = JsonResponse({"detail": "Server is overloaded, retry shortly."}, status=503)
+        response["Retry-After"] = str(self.config["retry_after"])
+        return response
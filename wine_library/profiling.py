@@ -0,0 +1,129 @@
+"""On-demand and sampled cProfile runs of API requests.
+
+Staff can profile a single request by sending ``X-Profile: 1`` (or
+``?profile=1``); the stats are stored under ``PROFILING["dir"]`` and can be
+downloaded from ``/api/profiles/<id>/``. With a non-zero ``sample_rate``
+random requests to the views in ``PROFILING["modules"]`` are profiled too and
+merged into per-view aggregates, reported by ``manage.py profile_report``.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.urls import Resolver404, resolve
+from drf_spectacular.utils import extend_schema
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from wine_library.metrics import view_label
+
+_lock = threading.Lock()
+_aggregates = {}
+_last_flush = time.monotonic()
+
+
+def profile_dir():
+    return Path(settings.PROFILING["dir"])
+
+
+def is_staff_request(request):
+    """Staff check usable before DRF authentication has run."""
+    if request.user.is_authenticated:
+        return request.user.is_staff
+    try:
+        authenticated = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return False
+    return bool(authenticated and authenticated[0].is_staff)
+
+
+def wants_profile(request):
+    return (
+        request.META.get("HTTP_X_PROFILE") == "1" or request.GET.get("profile") == "1"
+    ) and is_staff_request(request)
+
+
+def should_sample(request):
+    sample_rate = settings.PROFILING["sample_rate"]
+    if not sample_rate or random.random() >= sample_rate:
+        return False
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    view_module = getattr(match.func, "cls", match.func).__module__
+    return view_module in settings.PROFILING["modules"]
+
+
+def aggregate(label, profiler):
+    """Merge a sampled profile into this process' aggregate for the view."""
+    global _last_flush
+    with _lock:
+        if label in _aggregates:
+            _aggregates[label].add(profiler)
+        else:
+            _aggregates[label] = pstats.Stats(profiler)
+        if time.monotonic() - _last_flush < settings.PROFILING["flush_interval"]:
+            return
+        _last_flush = time.monotonic()
+        directory = profile_dir() / "aggregate"
+        directory.mkdir(parents=True, exist_ok=True)
+        for view, stats in _aggregates.items():
+            stats.dump_stats(directory / f"{view}.{os.getpid()}.prof")
+
+
+class ProfilingMiddleware:
+    """Run staff-requested and randomly sampled requests under cProfile."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        on_demand = wants_profile(request)
+        if not on_demand and not should_sample(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        response = profiler.runcall(self.get_response, request)
+
+        if on_demand:
+            profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            profile_dir().mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(profile_dir() / f"{profile_id}.prof")
+            response["X-Profile-Id"] = profile_id
+        else:
+            aggregate(view_label(request), profiler)
+        return response
+
+
+def format_stats(stats, sort="cumulative", limit=40, restrictions=()):
+    output = io.StringIO()
+    stats.stream = output
+    stats.sort_stats(sort).print_stats(*restrictions, limit)
+    return output.getvalue()
+
+
+class ProfileDownloadView(APIView):
+    """Download a stored profile as pstats (default) or as a text report (?as=txt)."""
+
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(exclude=True)
+    def get(self, request, profile_id):
+        path = profile_dir() / f"{profile_id}.prof"
+        if not path.exists():
+            raise Http404("Profile not found")
+
+        if request.query_params.get("as") == "txt":
+            return HttpResponse(format_stats(pstats.Stats(str(path))), content_type="text/plain")
+        return FileResponse(path.open("rb"), as_attachment=True, filename=path.name)
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import drf_spectacular
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+from wine_library import metrics
+from wine_library.compression import precompress
+
+SCHEMA_RENDERERS = {
+    "yaml": OpenApiYamlRenderer,
+    "json": OpenApiJsonRenderer,
+}
+
+_artifacts = {}
+_fingerprint = None
+_lock = threading.Lock()
+
+
+def schema_fingerprint():
+    """Hash of the project sources the schema is generated from.
+
+    The schema only changes when code changes, so the hash of every project
+    ``.py`` file (plus the spectacular version settings) identifies it.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256()
+        digest.update(drf_spectacular.__version__.encode())
+        digest.update(str(spectacular_settings.VERSION).encode())
+        for app in ("wine_library", "wines", "user"):
+            for path in sorted((Path(settings.BASE_DIR) / app).rglob("*.py")):
+                digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+                digest.update(path.read_bytes())
+        _fingerprint = digest.hexdigest()[:16]
+    return _fingerprint
+
+
+def artifact_path(fmt, fingerprint=None):
+    fingerprint = fingerprint or schema_fingerprint()
+    return Path(settings.OPENAPI_SCHEMA_DIR) / f"openapi-{fingerprint}.{fmt}"
+
+
+def generate_schema_artifacts():
+    """Render the schema in every format and write it to the artifact dir."""
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    directory = Path(settings.OPENAPI_SCHEMA_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for fmt, renderer_class in SCHEMA_RENDERERS.items():
+        content = renderer_class().render(schema, renderer_context={})
+        path = artifact_path(fmt)
+        tmp_path = path.with_suffix(f".{fmt}.tmp")
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def load_schema_artifact(fmt):
+    """Return ``(etag, content, precompressed)`` for the current code version.
+
+    The artifact is read from disk (or generated if missing) once per process
+    and kept in memory afterwards.
+    """
+    key = (str(settings.OPENAPI_SCHEMA_DIR), schema_fingerprint(), fmt)
+    artifact = _artifacts.get(key)
+    metrics.inc("cache_requests_total", {"cache": "schema", "result": "miss" if artifact is None else "hit"})
+    if artifact is None:
+        with _lock:
+            artifact = _artifacts.get(key)
+            if artifact is None:
+                path = artifact_path(fmt)
+                if not path.exists():
+                    generate_schema_artifacts()
+                content = path.read_bytes()
+                artifact = (
+                    f'"{schema_fingerprint()}-{fmt}"',
+                    content,
+                    precompress(content),
+                )
+                _artifacts[key] = artifact
+    return artifact
+
+
+class CachedSpectacularAPIView(SpectacularAPIView):
+    """Serve the pre-generated schema artifact with ETag and precompressed bodies."""
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("lang") or request.GET.get("version"):
+            return super().get(request, *args, **kwargs)
+
+        renderer, media_type = self.perform_content_negotiation(request)
+        etag, content, precompressed = load_schema_artifact(renderer.format)
+
+        # compressed responses carry the weak form of the ETag
+        if_none_match = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if etag in (tag.removeprefix("W/") for tag in if_none_match):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=media_type)
+            response.precompressed = precompressed
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "no-cache"
+        response["Vary"] = "Accept, Accept-Encoding"
+        return response
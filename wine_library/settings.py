@@ -51,13 +51,20 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "wine_library.metrics.MetricsMiddleware",
+    "wine_library.middleware.AdmissionControlMiddleware",
+    "wine_library.middleware.RequestTimingMiddleware",
+    "wine_library.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "wine_library.db_router.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "wine_library.profiling.ProfilingMiddleware",
+    "wines.middleware.SlowQueryMiddleware",
 ]
 
 ROOT_URLCONF = "wine_library.urls"
@@ -97,6 +104,33 @@ DATABASES = {
     }
 }
 
+# Read replicas (comma separated hosts), safe-method requests are routed to them
+DATABASE_REPLICAS = []
+for index, replica_host in enumerate(filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(","))):
+    alias = f"replica_{index + 1}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": replica_host.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["wine_library.db_router.ReplicaRouter"]
+
+REPLICA_ROUTING = {
+    # how long a user reads from the primary after a write (seconds)
+    "sticky_seconds": int(os.getenv("REPLICA_STICKY_SECONDS", "15")),
+    "max_lag_seconds": 5,
+    "lag_check_interval": 10,
+}
+
+# Cache shared by every worker process: read-your-writes pins, cache versions and cached responses.
+# Without REDIS_URL each process gets its own memory cache, which is only correct for a single process.
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}}
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
 
 
 # Password validation
@@ -170,6 +204,125 @@ SPECTACULAR_SETTINGS = {
     },
 }
 
+# Per-request query and latency budgets, over-budget requests are logged
+PERFORMANCE_BUDGETS = {
+    "default": {"queries": 20, "duration_ms": 500},
+    "views": {
+        # user, row estimate, exact count of small results, the page and which of its wines the user saved
+        "GET wines:wine-list": {"queries": 5},
+        # user, wine, its blend, its reviews and whether the user saved it
+        "GET wines:wine-detail": {"queries": 5},
+        "GET user:manage": {"queries": 2},
+        # user and the page, cursor pages are never counted
+        "GET user:manage_reviews": {"queries": 2},
+        # password hashing dominates these
+        "POST user:create": {"duration_ms": 1500},
+        "POST user:token_obtain_pair": {"duration_ms": 1500},
+    },
+}
+
+# gzip/brotli for JSON responses, see wine_library/compression.py
+COMPRESSION = {
+    "min_size": 1024,
+    "content_types": (
+        "application/json",
+        "application/vnd.oai.openapi",
+        "application/vnd.oai.openapi+json",
+    ),
+    # levels for on-the-fly compression, precompressed bodies use the maximum
+    "gzip_level": 6,
+    "brotli_quality": 5,
+}
+
+# Rendered wine list and detail responses, invalidated on catalog changes
+RESPONSE_CACHE = {
+    "timeout": 60,
+}
+
+# Sharing one execution of identical list pages, counts and details, see wine_library/singleflight.py
+SINGLE_FLIGHT = {
+    # coordinate the workers through the cache, only useful when it is shared
+    "across_workers": bool(REDIS_URL),
+    # seconds a request waits for a concurrent identical one before computing itself
+    "wait_timeout": 2.0,
+    # seconds after which the lock of a crashed leader expires
+    "lock_timeout": 30,
+    # seconds between checks for the result of a leader in another worker
+    "poll_interval": 0.01,
+    # seconds a published result stays readable by late followers
+    "result_timeout": 10,
+}
+
+# Paginators report planner estimates instead of COUNT(*) for large results
+ESTIMATED_COUNT = {
+    # results estimated above this many rows are not counted exactly
+    "threshold": 10000,
+    # how long a table's row estimate is cached (seconds)
+    "table_estimate_timeout": 60,
+}
+
+# Per-process concurrency limits and load shedding, see AdmissionControlMiddleware
+ADMISSION_CONTROL = {
+    # requests a worker process runs or queues at once, beyond it everything gets 503
+    "max_concurrent": 32,
+    # slots of max_concurrent only authenticated writes and unlimited views may take
+    "reserved": 8,
+    # seconds clients are told to wait before retrying a shed request
+    "retry_after": 1,
+    # ViewSet.action limits of the expensive views: running at once, waiting, and the wait in seconds
+    "views": {
+        "WineViewSet.list": {"concurrency": 8, "queue": 16, "timeout": 2.0},
+        "WineViewSet.retrieve": {"concurrency": 8, "queue": 16, "timeout": 2.0},
+        "WineViewSet.batch": {"concurrency": 4, "queue": 8, "timeout": 2.0},
+    },
+}
+
+# Incremental sync feed at /api/wines/changes/
+CHANGE_FEED = {
+    "page_size": 500,
+    "max_page_size": 1000,
+    # deleted wines stay in the feed this long; older cursors must resync
+    "retention_days": 30,
+}
+
+# In-memory typeahead indexes, see wines/autocomplete.py
+AUTOCOMPLETE = {
+    "max_results": 50,
+    # longer prefixes whose top results are kept per process
+    "prefix_cache_size": 10000,
+    # minimum seconds between rebuilds after another process changed wines
+    "rebuild_interval": 60,
+    # seconds between looks at the shared version, so lookups rarely touch the cache
+    "version_check_interval": 1,
+}
+
+# Opt-in capture of slow queries with EXPLAIN (ANALYZE, BUFFERS) output
+SLOW_QUERY_RECORDER = {
+    "enabled": os.getenv("SLOW_QUERY_RECORDER", "False") == "True",
+    "threshold_ms": 200,
+    "sample_rate": 0.1,
+    # record each filter signature at most once per interval (seconds)
+    "interval": 300,
+}
+
+# Prometheus metrics, shared between worker processes through METRICS_DIR
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = 5
+# bearer token of the scraper; without it /metrics is only open to staff sessions, or to anyone with DEBUG
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# cProfile runs: staff on demand (X-Profile: 1) and random sampling
+PROFILING = {
+    "dir": os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles")),
+    "sample_rate": float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    "modules": ("wines.views", "user.views"),
+    # seconds between dumps of the sampled aggregates
+    "flush_interval": 60,
+}
+
+# Pre-generated OpenAPI schema artifacts (see `manage.py generate_schema`)
+OPENAPI_SCHEMA_DIR = os.getenv("OPENAPI_SCHEMA_DIR", os.path.join(BASE_DIR, "schema"))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60 * 60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
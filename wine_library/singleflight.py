@@ -0,0 +1,108 @@
+"""Single-flight execution of identical expensive computations.
+
+Concurrent calls with the same key share one execution. Within a process
+the first caller leads and the others wait for its result. With
+``SINGLE_FLIGHT["across_workers"]`` (on when the cache is shared through
+``REDIS_URL``) the leader also holds a short lock in the cache, ``cache.add``
+of a token, and publishes the result under that token; leaders in other
+workers poll for it instead of computing. Followers that wait longer than
+``SINGLE_FLIGHT["wait_timeout"]``, or see the lock go away without a result,
+compute the result themselves, so a stuck or crashed leader only costs them
+the wait.
+
+Results are only shared while a computation is in flight; caching them for
+later requests is left to the callers.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+
+from wine_library import metrics
+
+_lock = threading.Lock()
+_flights = {}
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+def queryset_key(queryset):
+    """Key of the SQL a queryset runs, equal for requests that filter the same way."""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        # filters that can match no rows are not sent to the database at all
+        return f"{queryset.model._meta.label}:empty"
+    return hashlib.sha1(repr((queryset.db, sql, params)).encode()).hexdigest()
+
+
+def single_flight(key, compute):
+    """Return ``compute()``, sharing one execution between concurrent calls with the same key."""
+    with _lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        if flight.done.wait(settings.SINGLE_FLIGHT["wait_timeout"]) and not flight.failed:
+            metrics.inc("single_flight_total", {"result": "shared_in_process"})
+            return flight.result
+        metrics.inc("single_flight_total", {"result": "fallback"})
+        return compute()
+
+    try:
+        if settings.SINGLE_FLIGHT["across_workers"]:
+            flight.result = across_workers(key, compute)
+        else:
+            flight.result = compute()
+            metrics.inc("single_flight_total", {"result": "leader"})
+        return flight.result
+    except BaseException:
+        flight.failed = True
+        raise
+    finally:
+        with _lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def across_workers(key, compute):
+    """Return ``compute()``, or the result a leader in another worker publishes for the key."""
+    config = settings.SINGLE_FLIGHT
+    lock_key = f"single-flight:lock:{key}"
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, timeout=config["lock_timeout"]):
+        try:
+            result = compute()
+            # keyed by the flight, so a finished flight is never mistaken for a newer one
+            cache.set(f"single-flight:result:{token}", (result,), timeout=config["result_timeout"])
+        finally:
+            cache.delete(lock_key)
+        metrics.inc("single_flight_total", {"result": "leader"})
+        return result
+
+    token = cache.get(lock_key)
+    deadline = time.monotonic() + config["wait_timeout"]
+    while token is not None and time.monotonic() < deadline:
+        time.sleep(config["poll_interval"])
+        # the result is published before the lock is released, so read them in the other order
+        leading = cache.get(lock_key) == token
+        entry = cache.get(f"single-flight:result:{token}")
+        if entry is not None:
+            metrics.inc("single_flight_total", {"result": "shared_across_workers"})
+            return entry[0]
+        if not leading:
+            # the leader failed or its lock expired
+            break
+    metrics.inc("single_flight_total", {"result": "fallback"})
+    return compute()
@@ -0,0 +1,27 @@
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from wine_library.middleware import get_budget
+
+
+class QueryBudgetMixin:
+    """Test case mixin asserting that endpoints stay within a query budget."""
+
+    @contextmanager
+    def assertQueryBudget(self, view_name=None, queries=None):
+        """Fail if the block runs more queries than allowed.
+
+        The limit is ``queries`` if given, otherwise the budget configured for
+        ``view_name`` in ``PERFORMANCE_BUDGETS``.
+        """
+        limit = queries if queries is not None else get_budget(view_name)["queries"]
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > limit:
+            queries_sql = "\n".join(query["sql"] for query in context.captured_queries)
+            self.fail(
+                f"{view_name or 'block'} ran {executed} queries, budget is {limit}:\n{queries_sql}"
+            )
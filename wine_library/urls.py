@@ -19,18 +19,23 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from drf_spectacular.views import (
-    SpectacularAPIView,
     SpectacularSwaggerView,
     SpectacularRedocView,
 )
 
+from wine_library.metrics import metrics_view
+from wine_library.profiling import ProfileDownloadView
+from wine_library.schema import CachedSpectacularAPIView
+
 
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("api/wines/", include("wines.urls", namespace="wines")),
     path("api/user/", include("user.urls", namespace="user")),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("api/profiles/<slug:profile_id>/", ProfileDownloadView.as_view(), name="profile-download"),
+    path("api/schema/", CachedSpectacularAPIView.as_view(), name="schema"),
     path(
         "api/doc/swagger/",
         SpectacularSwaggerView.as_view(url_name="schema"),
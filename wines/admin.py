@@ -1,6 +1,111 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Avg, Count, Max
 
-from wines.models import Wine, WineReview
+from wines.cache import bump_catalog_version
+from wines.models import Country, Grape, Region, Style, Wine, WineGrape, WineReview, WineType, SlowQuery
+from wines.pagination import EstimatedCountPaginator
 
-admin.site.register(Wine)
-admin.site.register(WineReview)
+
+class WineGrapeInline(admin.TabularInline):
+    model = WineGrape
+    autocomplete_fields = ("grape",)
+    extra = 0
+
+
+@admin.register(Wine)
+class WineAdmin(admin.ModelAdmin):
+    """Wines, searchable by title through the trigram index"""
+
+    list_display = ("title", "vintage", "wine_type", "country", "price", "saved_count")
+    list_select_related = ("wine_type", "country")
+    list_filter = ("wine_type", "country")
+    autocomplete_fields = ("wine_type", "country", "region", "style")
+    inlines = (WineGrapeInline,)
+    search_fields = ("title",)
+    readonly_fields = ("saved_count",)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ("recount_saved",)
+
+    @admin.action(description="Recount saved count of selected wines")
+    def recount_saved(self, request, queryset):
+        fixed = Wine.objects.reconcile_saved_counts(queryset)
+        self.message_user(request, f"Fixed saved count of {fixed} wines.", messages.SUCCESS)
+
+
+@admin.register(Country, Region, Grape, WineType, Style)
+class DimensionAdmin(admin.ModelAdmin):
+    """Lookup values shared by wines; renaming one renames it on every wine"""
+
+    list_display = ("name", "key")
+    search_fields = ("name",)
+
+
+@admin.register(WineReview)
+class WineReviewAdmin(admin.ModelAdmin):
+    """Reviews with their wine and user joined instead of loaded per row"""
+
+    list_display = ("wine", "user", "rating", "created_at")
+    list_select_related = ("wine", "user")
+    autocomplete_fields = ("wine", "user")
+    search_fields = ("wine__title",)
+    # newest first through the primary key index instead of sorting by created_at
+    ordering = ("-id",)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ("delete_reviews", "clear_comments")
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # the default action loads and deletes every review one by one
+        actions.pop("delete_selected", None)
+        return actions
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        bump_catalog_version()
+
+    @admin.action(description="Delete selected reviews", permissions=["delete"])
+    def delete_reviews(self, request, queryset):
+        queryset = queryset.order_by()
+        with transaction.atomic():
+            wine_ids = list(queryset.values_list("wine_id", flat=True).distinct())
+            # reviews have no dependents or delete signals, so this is one DELETE, then one UPDATE of the ratings
+            deleted, _ = queryset.delete()
+            Wine.objects.refresh_ratings(Wine.objects.filter(pk__in=wine_ids))
+        bump_catalog_version()
+        self.message_user(request, f"Deleted {deleted} reviews.", messages.SUCCESS)
+
+    @admin.action(description="Clear comments of selected reviews", permissions=["change"])
+    def clear_comments(self, request, queryset):
+        updated = queryset.exclude(comment="").update(comment="")
+        bump_catalog_version()
+        self.message_user(request, f"Cleared comments of {updated} reviews.", messages.SUCCESS)
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    """Slow queries with a per filter signature summary above the list"""
+
+    list_display = ("filter_signature", "duration_ms", "view", "created_at")
+    list_filter = ("view",)
+    search_fields = ("filter_signature",)
+    readonly_fields = ("view", "path", "filter_signature", "sql", "duration_ms", "plan", "created_at")
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        signatures = (
+            SlowQuery.objects.values("filter_signature")
+            .annotate(
+                count=Count("id"),
+                avg_duration=Avg("duration_ms"),
+                max_duration=Max("duration_ms"),
+                last_seen=Max("created_at"),
+            )
+            .order_by("-count", "-max_duration")[:50]
+        )
+        extra_context = {**(extra_context or {}), "signatures": signatures}
+        return super().changelist_view(request, extra_context=extra_context)
@@ -0,0 +1,254 @@
+"""In-memory prefix indexes for typeahead on wine titles, grapes and regions.
+
+Each process keeps one sorted index of distinct normalized values per field,
+weighted by popularity. Top results of one and two character prefixes are
+precomputed and longer prefixes are cached after their first lookup, so a
+lookup is a dict hit or a bisect over a small range.
+
+Wines saved or deleted in this process are applied incrementally: the
+values and weights a wine had before the write are discarded and its new ones
+added. Every change also bumps a shared version in the cache; other processes
+look at it at most once per ``AUTOCOMPLETE["version_check_interval"]``
+seconds and rebuild when they see a new one, at most once per
+``AUTOCOMPLETE["rebuild_interval"]`` seconds.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from wines.models import Country, Grape, Region, Wine, WineGrape, normalize_name
+
+FIELDS = ("title", "grape", "region", "country")
+LOOKUPS = {"grape": Grape, "region": Region, "country": Country}
+VERSION_KEY = "autocomplete:version"
+PRECOMPUTED_PREFIX_LENGTH = 2
+
+
+class PrefixIndex:
+    def __init__(self, weighted_values, max_results, cache_size):
+        self.max_results = max_results
+        self.cache_size = cache_size
+        self.entries = {}
+        for value, weight in weighted_values:
+            key = normalize_name(value)
+            if not key:
+                continue
+            display, current = self.entries.get(key, (value, 0))
+            self.entries[key] = (display, current + weight)
+        self.keys = sorted(self.entries)
+        # guards keys, entries and the LRU of longer prefixes against concurrent lookups and updates
+        self.lock = threading.Lock()
+        self.top_cache = OrderedDict()
+        self.precompute()
+
+    def precompute(self):
+        """Top results for every prefix of up to PRECOMPUTED_PREFIX_LENGTH chars."""
+        candidates = {}
+        for key in self.keys:
+            for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+                if len(key) >= length:
+                    heap = candidates.setdefault(key[:length], [])
+                    item = (self.entries[key][1], key)
+                    if len(heap) < self.max_results:
+                        heapq.heappush(heap, item)
+                    elif item > heap[0]:
+                        heapq.heapreplace(heap, item)
+        self.precomputed = {
+            prefix: [self.entries[key] for _, key in sorted(heap, reverse=True)]
+            for prefix, heap in candidates.items()
+        }
+
+    def search(self, prefix, limit):
+        prefix = normalize_name(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return self.precomputed.get(prefix, [])[:limit]
+
+        with self.lock:
+            results = self.top_cache.get(prefix)
+            if results is None:
+                start = bisect_left(self.keys, prefix)
+                end = bisect_left(self.keys, prefix + "\uffff", start)
+                top_keys = heapq.nlargest(
+                    self.max_results, self.keys[start:end], key=lambda key: self.entries[key][1]
+                )
+                results = [self.entries[key] for key in top_keys]
+                self.top_cache[prefix] = results
+                if len(self.top_cache) > self.cache_size:
+                    self.top_cache.popitem(last=False)
+            else:
+                self.top_cache.move_to_end(prefix)
+        return results[:limit]
+
+    def add(self, value, weight=1):
+        key = normalize_name(value)
+        if not key:
+            return
+        with self.lock:
+            if key in self.entries:
+                display, current = self.entries[key]
+                self.entries[key] = (display, current + weight)
+            else:
+                self.entries[key] = (value, weight)
+                insort(self.keys, key)
+            self.invalidate(key)
+
+    def discard(self, value, weight=1):
+        key = normalize_name(value)
+        with self.lock:
+            if key not in self.entries:
+                return
+            display, current = self.entries[key]
+            if current > weight:
+                self.entries[key] = (display, current - weight)
+            else:
+                del self.entries[key]
+                del self.keys[bisect_left(self.keys, key)]
+            self.invalidate(key)
+
+    def invalidate(self, key):
+        for length in range(1, len(key) + 1):
+            self.top_cache.pop(key[:length], None)
+        self.precompute_prefixes(key)
+
+    def precompute_prefixes(self, key):
+        for length in range(1, min(len(key), PRECOMPUTED_PREFIX_LENGTH) + 1):
+            prefix = key[:length]
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + "\uffff", start)
+            top_keys = heapq.nlargest(
+                self.max_results, self.keys[start:end], key=lambda item: self.entries[item][1]
+            )
+            self.precomputed[prefix] = [self.entries[item] for item in top_keys]
+
+
+_lock = threading.Lock()
+_indexes = {}
+_built_version = None
+_built_at = 0.0
+_checked_at = None
+
+
+def build_indexes():
+    config = settings.AUTOCOMPLETE
+    weighted = {
+        # titles are weighted by how often they are reviewed, the rest by wine count
+        "title": Wine.objects.values_list("title").annotate(weight=Count("reviews") + 1),
+    }
+    for field, model in LOOKUPS.items():
+        weighted[field] = (
+            model.objects.values_list("name")
+            .annotate(weight=Count("wines"))
+            .filter(weight__gt=0)
+        )
+    return {
+        field: PrefixIndex(
+            values.order_by(), config["max_results"], config["prefix_cache_size"]
+        )
+        for field, values in weighted.items()
+    }
+
+
+def current_version():
+    return cache.get_or_set(VERSION_KEY, 1, timeout=None)
+
+
+def get_index(field):
+    global _indexes, _built_version, _built_at, _checked_at
+    now = time.monotonic()
+    if _indexes and _checked_at is not None and now - _checked_at < settings.AUTOCOMPLETE["version_check_interval"]:
+        return _indexes[field]
+    version = current_version()
+    _checked_at = now
+    if version != _built_version and (
+        not _indexes or time.monotonic() - _built_at >= settings.AUTOCOMPLETE["rebuild_interval"]
+    ):
+        with _lock:
+            if version != _built_version:
+                _indexes = build_indexes()
+                _built_version = version
+                _built_at = time.monotonic()
+    return _indexes[field]
+
+
+def search(field, prefix, limit):
+    return [
+        {"value": display, "weight": weight}
+        for display, weight in get_index(field).search(prefix, limit)
+    ]
+
+
+def _bump_version(applied):
+    global _built_version
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, timeout=None)
+        version = 2
+    if applied and _built_version == version - 1:
+        # this process already applied the change incrementally
+        _built_version = version
+
+
+def indexed_values(wines):
+    """``(field, value, weight)`` the wines contribute to the indexes, as ``build_indexes`` weighs them.
+
+    ``None`` when this process has no indexes to update.
+    """
+    if not _indexes:
+        return None
+    pks = [wine.pk for wine in wines]
+    rows = (
+        Wine.objects.filter(pk__in=pks)
+        .values_list("pk", "title", "region__name", "country__name")
+        .annotate(weight=Count("reviews") + 1)
+        .order_by()
+    )
+    values = []
+    for _, title, region, country, weight in rows:
+        values += [("title", title, weight), ("region", region, 1), ("country", country, 1)]
+    grapes = WineGrape.objects.filter(wine__in=pks).values_list("grape__name", flat=True)
+    return [*values, *(("grape", grape, 1) for grape in grapes)]
+
+
+def wines_saved(wines, previous):
+    """Apply saved wines, given their ``indexed_values`` from before the write (``[]`` if created)."""
+    with _lock:
+        applied = bool(_indexes) and previous is not None
+        if applied:
+            for field, value, weight in previous:
+                _indexes[field].discard(value, weight)
+            for field, value, weight in indexed_values(wines):
+                _indexes[field].add(value, weight)
+        _bump_version(applied)
+
+
+def wine_deleted(previous):
+    """Apply a deleted wine, given its ``indexed_values`` from before the delete."""
+    with _lock:
+        applied = bool(_indexes) and previous is not None
+        if applied:
+            for field, value, weight in previous:
+                _indexes[field].discard(value, weight)
+        _bump_version(applied)
+
+
+def invalidate():
+    """Rebuild every process' indexes, e.g. after lookup values were renamed."""
+    with _lock:
+        _bump_version(False)
+
+
+def reset():
+    global _indexes, _built_version, _checked_at
+    with _lock:
+        _indexes = {}
+        _built_version = None
+        _checked_at = None
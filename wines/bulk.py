@@ -0,0 +1,143 @@
+"""Batch validation and writes behind ``WineViewSet.bulk``.
+
+Every payload is validated with ``WineBulkSerializer``; ``unique_wine_entry``
+is checked for the whole batch with one query instead of one per item, then
+valid wines are written with a single ``bulk_create``/``bulk_update``.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from wines import autocomplete
+from wines.models import Wine, WineGrape, parse_vintage_year
+from wines.serializers import WineBulkSerializer
+from wines.signals import wines_saved
+
+UNIQUE_FIELDS = ("title", "vintage", "capacity")
+DUPLICATE_ENTRY = "A wine with this title, vintage and capacity already exists."
+
+
+def entry_key(values):
+    # NULL capacities never conflict in the unique constraint
+    if values.get("capacity") is None:
+        return None
+    return tuple(values.get(field, "") for field in UNIQUE_FIELDS)
+
+
+def check_unique_entries(entries, results):
+    """Flag entries clashing with each other or with stored wines.
+
+    ``entries`` maps an item index to ``(key, wine id or None)``.
+    """
+    keys = {key for key, _ in entries.values() if key is not None}
+    existing = {}
+    if keys:
+        stored = Wine.objects.filter(title__in={key[0] for key in keys}).values_list(
+            *UNIQUE_FIELDS, "id"
+        ).order_by()
+        existing = {(title, vintage, capacity): pk for title, vintage, capacity, pk in stored}
+
+    seen = {}
+    for index, (key, pk) in entries.items():
+        if key is None:
+            continue
+        if (key in existing and existing[key] != pk) or key in seen:
+            results[index] = {
+                "index": index,
+                "status": "error",
+                "errors": {"non_field_errors": [DUPLICATE_ENTRY]},
+            }
+        else:
+            seen[key] = index
+
+
+def finish(results, wines, write, partial_success):
+    """Write the valid wines unless an item failed and partial success is off.
+
+    ``write`` gets the indexes of the valid items.
+    """
+    failed = any(result["status"] == "error" for result in results)
+    if failed and not partial_success:
+        for result in results:
+            if result["status"] != "error":
+                result["status"] = "skipped"
+        return results, False
+
+    valid = [result["index"] for result in results if result["status"] != "error"]
+    if valid:
+        with transaction.atomic():
+            write(valid)
+    for result in results:
+        if result["status"] != "error":
+            result["id"] = wines[result["index"]].pk
+    return results, bool(valid)
+
+
+def bulk_create_wines(items, partial_success=False):
+    """Validate and create wines. Returns ``(results, written)``."""
+    results, wines, entries, blends, validated = [], {}, {}, {}, {}
+    context = {"dimensions": {}}
+    for index, item in enumerate(items):
+        serializer = WineBulkSerializer(data=item, context=context)
+        if not serializer.is_valid():
+            results.append({"index": index, "status": "error", "errors": serializer.errors})
+            continue
+        blends[index] = serializer.pop_blend(serializer.validated_data)
+        validated[index] = serializer.validated_data
+        wine = Wine(**serializer.validated_data)
+        wine.vintage_year = parse_vintage_year(wine.vintage)
+        wines[index] = wine
+        entries[index] = (entry_key(serializer.validated_data), None)
+        results.append({"index": index, "status": "created"})
+    check_unique_entries(entries, results)
+
+    def write(valid):
+        for index in valid:
+            WineBulkSerializer.save_new_dimensions(validated[index], blends[index])
+        Wine.objects.bulk_create([wines[index] for index in valid])
+        WineGrape.objects.set_blends(
+            (wines[index], blends[index]) for index in valid if blends[index] is not None
+        )
+        wines_saved([wines[index] for index in valid], created=True)
+
+    return finish(results, wines, write, partial_success)
+
+
+def bulk_update_wines(items, partial_success=False):
+    """Validate and partially update wines identified by ``id``. Returns ``(results, written)``."""
+    ids = [item.get("id") for item in items if isinstance(item, dict)]
+    instances = Wine.objects.in_bulk([pk for pk in ids if isinstance(pk, int)])
+    results, wines, entries, blends, validated, fields = [], {}, {}, {}, {}, set()
+    context = {"dimensions": {}}
+    for index, item in enumerate(items):
+        wine = instances.get(item.get("id")) if isinstance(item, dict) else None
+        if wine is None:
+            results.append({"index": index, "status": "error", "errors": {"id": ["Wine not found."]}})
+            continue
+        serializer = WineBulkSerializer(wine, data=item, partial=True, context=context)
+        if not serializer.is_valid():
+            results.append({"index": index, "status": "error", "errors": serializer.errors})
+            continue
+        blends[index] = serializer.pop_blend(serializer.validated_data)
+        validated[index] = serializer.validated_data
+        for field, value in serializer.validated_data.items():
+            setattr(wine, field, value)
+        fields.update(serializer.validated_data)
+        wine.vintage_year = parse_vintage_year(wine.vintage)
+        wine.updated_at = timezone.now()
+        wines[index] = wine
+        entries[index] = (entry_key({field: getattr(wine, field) for field in UNIQUE_FIELDS}), wine.pk)
+        results.append({"index": index, "status": "updated"})
+    check_unique_entries(entries, results)
+
+    def write(valid):
+        updated = [wines[index] for index in valid]
+        for index in valid:
+            WineBulkSerializer.save_new_dimensions(validated[index], blends[index])
+        previous = autocomplete.indexed_values(updated)
+        Wine.objects.bulk_update(updated, [*fields, "vintage_year", "updated_at"], batch_size=1000)
+        WineGrape.objects.set_blends(
+            (wines[index], blends[index]) for index in valid if blends[index] is not None
+        )
+        wines_saved(updated, created=False, previous=previous)
+
+    return finish(results, wines, write, partial_success)
@@ -0,0 +1,144 @@
+"""Cache of rendered wine list and detail responses.
+
+Entries hold the rendered JSON together with its precompressed forms, so a
+hit is served without touching the database, the serializers or the
+compressor. Keys include a catalog version that ``bump_catalog_version`` moves
+on every wine or review change; old entries simply stop being read and expire
+after ``RESPONSE_CACHE["timeout"]`` seconds. Saved counts are not versioned
+and may lag by up to that timeout.
+
+Entries and versions live in the default cache, which all workers share
+when ``REDIS_URL`` is set, so a change made through one worker invalidates
+the responses every worker cached. Without it each process has its own
+cache, and other processes keep serving their entries until they expire.
+
+A replica may still return the old rows for a while after a change, so
+responses read from a replica are not stored until replicas had time to
+catch up; otherwise they would be cached under the new version.
+
+Responses carry the user's ``is_saved`` flags, so keys also include the user
+and a per-user version that ``bump_saved_versions`` moves when their saved
+wines change.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from wine_library import metrics
+from wine_library.compression import precompress
+from wine_library.db_router import current_replica
+
+VERSION_KEY = "catalog:version"
+CHANGED_KEY = "catalog:changed"
+SAVED_VERSION_KEY = "saved:version:{}"
+
+
+def catalog_version():
+    return cache.get_or_set(VERSION_KEY, 1, timeout=None)
+
+
+def _incr_version(key=VERSION_KEY):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+
+
+def _catalog_changed():
+    _incr_version()
+    if settings.DATABASE_REPLICAS:
+        routing = settings.REPLICA_ROUTING
+        # replicas lag up to max_lag_seconds and stay in rotation until their next lag check
+        cache.set(CHANGED_KEY, 1, timeout=routing["max_lag_seconds"] + routing["lag_check_interval"])
+
+
+def bump_catalog_version():
+    """Invalidate cached responses now and again once the transaction commits.
+
+    The second bump drops entries cached by requests that read the old rows
+    between the first bump and the commit.
+    """
+    _catalog_changed()
+    transaction.on_commit(_catalog_changed)
+
+
+def may_be_stale():
+    """Whether the request read from a replica that may not have the latest catalog change yet."""
+    return current_replica() is not None and cache.get(CHANGED_KEY) is not None
+
+
+def saved_version(user):
+    if not user.is_authenticated:
+        return "anonymous"
+    return f"{user.pk}.{cache.get_or_set(SAVED_VERSION_KEY.format(user.pk), 1, timeout=None)}"
+
+
+def bump_saved_versions(user_ids):
+    """Invalidate the users' cached responses, now and once the transaction commits."""
+    keys = [SAVED_VERSION_KEY.format(user_id) for user_id in user_ids]
+
+    def incr():
+        for key in keys:
+            _incr_version(key)
+
+    incr()
+    transaction.on_commit(incr)
+
+
+def request_digest(request, action, kwargs):
+    """Digest of an action, its URL kwargs and its query parameters in any order."""
+    query = sorted(request.query_params.lists())
+    return hashlib.sha1(repr((action, sorted(kwargs.items()), query)).encode()).hexdigest()
+
+
+def response_cache_key(request, action, kwargs):
+    return (
+        f"response:{catalog_version()}:{saved_version(request.user)}:"
+        f"{request.accepted_renderer.format}:{request_digest(request, action, kwargs)}"
+    )
+
+
+class CachedResponseMixin:
+    """Serve ``list`` and ``retrieve`` from the response cache, filling it on a miss.
+
+    Other read-only actions can opt in by returning ``dispatch_cached(handler, ...)``.
+    """
+
+    def dispatch_cached(self, handler, request, *args, **kwargs):
+        if request.accepted_renderer.format != "json":
+            return handler(request, *args, **kwargs)
+
+        key = response_cache_key(request, self.action, kwargs)
+        entry = cache.get(key)
+        metrics.inc("cache_requests_total", {"cache": "response", "result": "miss" if entry is None else "hit"})
+        if entry is not None:
+            content, content_type, precompressed = entry
+            response = HttpResponse(content, content_type=content_type)
+            response.precompressed = precompressed
+            return response
+
+        response = handler(request, *args, **kwargs)
+        response.cache_key = key
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(response, "cache_key", None)
+        if key is not None and response.status_code == 200 and not may_be_stale():
+            response.render()
+            response.precompressed = precompress(response.content)
+            cache.set(
+                key,
+                (response.content, response["Content-Type"], response.precompressed),
+                timeout=settings.RESPONSE_CACHE["timeout"],
+            )
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.dispatch_cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.dispatch_cached(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,213 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from wines.models import Wine
+
+User = get_user_model()
+
+# Filters accepted by WineViewSet.get_queryset, with a representative value
+LIST_FILTERS = {
+    "title": "chateau",
+    "wine_type": "Red",
+    "grape": "merlot",
+    "country": "France",
+    "min_price": "10",
+    "max_price": "50",
+    "min_abv": "11.5",
+    "max_abv": "14",
+    "min_capacity": "0.5",
+    "max_capacity": "1",
+    "min_rating": "5",
+    "max_rating": "9",
+    "min_vintage": "2010",
+    "max_vintage": "2018",
+    "min_saved": "20",
+    "ordering": "-vintage",
+}
+
+# grapes of a blend, matched with grape_match=any and grape_match=all
+BLEND_GRAPES = "merlot,cabernet"
+
+# every ?ordering is benchmarked both ways, alone and after a multi-value filter
+ORDERINGS = ("price", "abv", "vintage", "rating", "saved_count", "updated_at")
+MULTI_VALUE_FILTER = "country=France,Italy,Spain"
+
+LIST_FILTER_COMBINATIONS = [
+    ("wine_type", "country"),
+    ("min_price", "max_price"),
+    ("min_vintage", "max_vintage", "ordering"),
+    ("country", "min_price", "max_price", "min_rating"),
+    ("title", "grape", "min_abv", "max_abv"),
+    tuple(LIST_FILTERS),
+]
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    """Django command to benchmark API endpoints and compare with a baseline."""
+
+    help = (
+        "Measure p50/p99 latency, queries per request and response size for "
+        "the wine and user endpoints, optionally failing on regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", action="store_true", help="Seed a dataset before benchmarking")
+        parser.add_argument("--wines", type=int, default=100_000)
+        parser.add_argument("--reviews", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=50_000)
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear the response cache before every request to measure the database path",
+        )
+        parser.add_argument("--output", help="Write results as a JSON baseline to this file")
+        parser.add_argument("--compare", help="Compare results with this JSON baseline")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Allowed relative regression for latency and size (0.2 = 20%%)",
+        )
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            call_command(
+                "seed_catalog",
+                wines=options["wines"],
+                reviews=options["reviews"],
+                users=options["users"],
+                stdout=self.stdout,
+            )
+
+        user = (
+            User.objects.annotate(saved=Count("saved_wines")).order_by("-saved").first()
+        )
+        if user is None or not Wine.objects.exists():
+            raise CommandError("No data to benchmark, run with --seed first.")
+
+        client = APIClient()
+        client.force_authenticate(user)
+
+        results = {}
+        for name, url in self.get_scenarios():
+            results[name] = self.measure(
+                client, url, options["iterations"], options["warmup"], options["cold"]
+            )
+            self.stdout.write(
+                f"{name:<60} p50={results[name]['p50_ms']:8.2f}ms "
+                f"p99={results[name]['p99_ms']:8.2f}ms "
+                f"queries={results[name]['queries']:3d} "
+                f"bytes={results[name]['bytes']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                json.dump(results, output, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['output']}")
+
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as baseline_file:
+                baseline = json.load(baseline_file)
+            regressions = self.compare(baseline, results, options["threshold"])
+            if regressions:
+                raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    def get_scenarios(self):
+        list_url = reverse("wines:wine-list")
+        scenarios = [("wines:list", list_url)]
+        for name, value in LIST_FILTERS.items():
+            scenarios.append((f"wines:list?{name}", f"{list_url}?{name}={value}"))
+        for combination in LIST_FILTER_COMBINATIONS:
+            query = "&".join(f"{name}={LIST_FILTERS[name]}" for name in combination)
+            scenarios.append((f"wines:list?{'+'.join(combination)}", f"{list_url}?{query}"))
+        for match in ("any", "all"):
+            scenarios.append(
+                (f"wines:list?grape[blend,{match}]", f"{list_url}?grape={BLEND_GRAPES}&grape_match={match}")
+            )
+        for field in ORDERINGS:
+            for ordering in (field, f"-{field}"):
+                scenarios.append((f"wines:list?ordering={ordering}", f"{list_url}?ordering={ordering}"))
+            scenarios.append(
+                (
+                    f"wines:list?country[3]+ordering=-{field}",
+                    f"{list_url}?{MULTI_VALUE_FILTER}&ordering=-{field}",
+                )
+            )
+
+        most_reviewed = (
+            Wine.objects.annotate(review_count=Count("reviews")).order_by("-review_count").first()
+        )
+        scenarios.append(
+            ("wines:detail[most-reviewed]", reverse("wines:wine-detail", args=[most_reviewed.id]))
+        )
+        batch_ids = ",".join(map(str, Wine.objects.order_by("id").values_list("id", flat=True)[:100]))
+        scenarios.append(("wines:batch[100]", f"{reverse('wines:wine-batch')}?ids={batch_ids}"))
+        autocomplete_url = reverse("wines:wine-autocomplete")
+        scenarios.append(("wines:autocomplete?title", f"{autocomplete_url}?field=title&prefix=ch"))
+        scenarios.append(("user:manage", reverse("user:manage")))
+        return scenarios
+
+    def measure(self, client, url, iterations, warmup, cold=False):
+        for _ in range(warmup):
+            client.get(url)
+
+        timings, queries = [], []
+        size = 0
+        for _ in range(iterations):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"GET {url} returned {response.status_code}")
+            queries.append(len(context.captured_queries))
+            size = len(response.content)
+
+        return {
+            "url": url,
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "mean_ms": round(statistics.mean(timings), 3),
+            "queries": max(queries),
+            "bytes": size,
+        }
+
+    @staticmethod
+    def compare(baseline, results, threshold):
+        regressions = []
+        for name, previous in baseline.items():
+            current = results.get(name)
+            if current is None:
+                continue
+            for metric in ("p50_ms", "p99_ms", "bytes"):
+                if current[metric] > previous[metric] * (1 + threshold):
+                    regressions.append(
+                        f"{name}: {metric} {previous[metric]} -> {current[metric]}"
+                    )
+            if current["queries"] > previous["queries"]:
+                regressions.append(
+                    f"{name}: queries {previous['queries']} -> {current['queries']}"
+                )
+        return regressions
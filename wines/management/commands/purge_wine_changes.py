@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from wines.models import WineChange
+
+
+class Command(BaseCommand):
+    """Django command to compact the wine change feed and purge expired tombstones."""
+
+    def handle(self, *args, **options):
+        newer = WineChange.objects.filter(
+            Q(txid__gt=OuterRef("txid")) | Q(txid=OuterRef("txid"), id__gt=OuterRef("id")),
+            wine_id=OuterRef("wine_id"),
+        )
+        compacted, _ = (
+            WineChange.objects.exclude(action=WineChange.PURGED).filter(Exists(newer)).delete()
+        )
+
+        cutoff = timezone.now() - timedelta(days=settings.CHANGE_FEED["retention_days"])
+        with transaction.atomic():
+            expired = Q(action=WineChange.DELETED, changed_at__lt=cutoff)
+            newest = (
+                WineChange.objects.filter(expired | Q(action=WineChange.PURGED))
+                .order_by("-txid", "-id")
+                .first()
+            )
+            purged, _ = WineChange.objects.filter(expired).delete()
+            if purged:
+                # takes the place of the newest purged tombstone: only cursors from before it
+                # may have missed deletes, newer ones keep syncing incrementally
+                WineChange.objects.filter(action=WineChange.PURGED).delete()
+                WineChange.objects.create(
+                    id=newest.id, txid=newest.txid, wine_id=0, action=WineChange.PURGED
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Compacted {compacted} changes, purged {purged} tombstones.")
+        )
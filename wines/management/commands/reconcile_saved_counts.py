@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from wines.models import Wine
+
+
+class Command(BaseCommand):
+    """Django command to recount Wine.saved_count from the users' saved wines."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Wines recounted per UPDATE, keeps row locks short.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        max_id = Wine.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        fixed = 0
+        for start in range(0, max_id + 1, batch_size):
+            fixed += Wine.objects.reconcile_saved_counts(
+                Wine.objects.filter(id__gte=start, id__lt=start + batch_size)
+            )
+        self.stdout.write(self.style.SUCCESS(f"Fixed saved_count of {fixed} wines."))
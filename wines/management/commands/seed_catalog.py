@@ -0,0 +1,343 @@
+import csv
+import io
+import itertools
+import multiprocessing
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Max
+
+from wines.models import DIMENSIONS, NON_VINTAGE, Grape, Wine, WineChange, WineGrape, WineReview
+
+User = get_user_model()
+SavedWine = User.saved_wines.through
+
+# country -> (regions, grapes) so generated wines look like real ones
+CATALOG = {
+    "France": (
+        ["Bordeaux", "Burgundy", "Champagne", "Rhone Valley", "Loire Valley", "Alsace"],
+        ["Merlot", "Cabernet Sauvignon", "Pinot Noir", "Chardonnay", "Syrah", "Sauvignon Blanc"],
+    ),
+    "Italy": (
+        ["Tuscany", "Piedmont", "Veneto", "Sicily", "Puglia"],
+        ["Sangiovese", "Nebbiolo", "Barbera", "Pinot Grigio", "Primitivo", "Nero d'Avola"],
+    ),
+    "Spain": (
+        ["Rioja", "Ribera del Duero", "Priorat", "Rias Baixas", "Cava"],
+        ["Tempranillo", "Garnacha", "Albarino", "Monastrell", "Macabeo"],
+    ),
+    "USA": (
+        ["Napa Valley", "Sonoma", "Willamette Valley", "Paso Robles", "Columbia Valley"],
+        ["Cabernet Sauvignon", "Zinfandel", "Pinot Noir", "Chardonnay", "Merlot"],
+    ),
+    "Argentina": (["Mendoza", "Salta", "Patagonia"], ["Malbec", "Torrontes", "Bonarda"]),
+    "Chile": (
+        ["Maipo Valley", "Colchagua", "Casablanca"],
+        ["Carmenere", "Cabernet Sauvignon", "Sauvignon Blanc"],
+    ),
+    "Germany": (["Mosel", "Rheingau", "Pfalz"], ["Riesling", "Spatburgunder", "Silvaner"]),
+    "Portugal": (["Douro", "Alentejo", "Vinho Verde"], ["Touriga Nacional", "Alvarinho", "Baga"]),
+    "Australia": (["Barossa Valley", "McLaren Vale", "Margaret River"], ["Shiraz", "Grenache"]),
+    "New Zealand": (["Marlborough", "Central Otago"], ["Sauvignon Blanc", "Pinot Noir"]),
+}
+COUNTRY_WEIGHTS = [30, 25, 15, 12, 5, 4, 3, 3, 2, 1]
+WINE_TYPES = ["Red", "White", "Rose", "Sparkling", "Dessert"]
+WINE_TYPE_WEIGHTS = [50, 30, 8, 9, 3]
+STYLES = ["Dry", "Off-dry", "Medium", "Sweet", "Full-bodied", "Light-bodied"]
+PRODUCER_PREFIXES = ["Chateau", "Domaine", "Bodega", "Tenuta", "Quinta", "Weingut", "Estate", "Cantina"]
+SYLLABLES = [
+    "la", "ro", "mar", "ven", "tor", "bel", "san", "vi", "co", "del",
+    "mon", "ta", "ri", "lu", "gra", "fe", "no", "ca", "par", "sel",
+]
+CAPACITIES = [0.375, 0.75, 0.75, 0.75, 1.5]
+BLEND_SHARE = 0.25  # wines made of two or three grapes
+
+REVIEW_CHUNK = 2_000  # wines per review task
+DEFAULT_WORKERS = max(1, min(8, multiprocessing.cpu_count()))
+
+
+def producer_name(index):
+    """Bijective mapping from an index to a pronounceable producer name."""
+    parts = []
+    index += len(SYLLABLES)
+    while index:
+        index, remainder = divmod(index, len(SYLLABLES))
+        parts.append(SYLLABLES[remainder])
+    return "".join(parts).capitalize()
+
+
+def blend_shares(rng, count):
+    """Random integer percentages adding up to 100, largest first."""
+    cuts = sorted(rng.sample(range(1, 100), count - 1))
+    return sorted((b - a for a, b in zip([0, *cuts], [*cuts, 100])), reverse=True)
+
+
+def zipf_weights(count, exponent=1.1):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def copy_rows(model, columns, rows):
+    """Write rows into the model table with a single COPY statement."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(
+        [r"\N" if value is None else value for value in row] for row in rows
+    )
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {model._meta.db_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer,
+        )
+
+
+def run_task(task):
+    """Entry point for worker processes, returns the number of rows written."""
+    function, args = task
+    written = function(*args)
+    connections.close_all()
+    return written
+
+
+def resolve_dimensions():
+    """``{field: {name: lookup id}}`` for every generated type, country, region, grape and style."""
+    names = {
+        "wine_type": WINE_TYPES,
+        "country": list(CATALOG),
+        "region": [region for regions, _ in CATALOG.values() for region in regions],
+        "grape": [grape for _, grapes in CATALOG.values() for grape in grapes],
+        "style": STYLES,
+    }
+    models = {**DIMENSIONS, "grape": Grape}
+    return {
+        field: {name: models[field].objects.resolve(name).id for name in values}
+        for field, values in names.items()
+    }
+
+
+def write_users(seed, start, stop, password, joined_from):
+    rng = random.Random(f"{seed}:users:{start}")
+    rows = []
+    for index in range(start, stop):
+        joined = joined_from + timedelta(seconds=rng.randint(0, 5 * 365 * 86400))
+        rows.append(
+            (password, False, "", "", False, True, joined.isoformat(), f"seed{index}@example.com")
+        )
+    copy_rows(
+        User,
+        ["password", "is_superuser", "first_name", "last_name", "is_staff", "is_active",
+         "date_joined", "email"],
+        rows,
+    )
+    return len(rows)
+
+
+def write_wines(seed, start, stop, dimension_ids):
+    rng = random.Random(f"{seed}:wines:{start}")
+    countries = list(CATALOG)
+    now = datetime.now(timezone.utc).isoformat()
+    rows, blend_rows = [], []
+    for index in range(start, stop):
+        country = rng.choices(countries, COUNTRY_WEIGHTS)[0]
+        regions, grapes = CATALOG[country]
+        grape = rng.choice(grapes)
+        blend = [grape]
+        if rng.random() < BLEND_SHARE and len(grapes) > 1:
+            others = [other for other in grapes if other != grape]
+            blend += rng.sample(others, min(len(others), rng.randint(1, 2)))
+        blend_rows.extend(
+            (index, dimension_ids["grape"][name], share)
+            for name, share in zip(blend, blend_shares(rng, len(blend)))
+        )
+        wine_type = rng.choices(WINE_TYPES, WINE_TYPE_WEIGHTS)[0]
+        title = f"{rng.choice(PRODUCER_PREFIXES)} {producer_name(index)} {grape}"
+        if wine_type == "Sparkling" and rng.random() < 0.4:
+            vintage_year = None
+        else:
+            vintage_year = min(2024, int(rng.triangular(1970, 2024, 2020)))
+        rows.append(
+            (
+                index,
+                title,
+                "",
+                round(rng.lognormvariate(3.2, 0.7), 2),
+                dimension_ids["wine_type"][wine_type],
+                round(rng.uniform(9, 15.5), 1),
+                NON_VINTAGE if vintage_year is None else str(vintage_year),
+                vintage_year,
+                dimension_ids["country"][country],
+                dimension_ids["region"][rng.choice(regions)],
+                "",
+                dimension_ids["style"][rng.choice(STYLES)],
+                rng.choice(CAPACITIES),
+                0,
+                now,
+            )
+        )
+    copy_rows(
+        Wine,
+        ["id", "title", "description", "price", "wine_type_id", "abv", "vintage", "vintage_year",
+         "country_id", "region_id", "characteristics", "style_id", "capacity", "saved_count", "updated_at"],
+        rows,
+    )
+    copy_rows(WineGrape, ["wine_id", "grape_id", "percentage"], blend_rows)
+    return len(rows)
+
+
+def write_reviews(seed, wine_ids, review_counts, user_ids, created_from):
+    rng = random.Random(f"{seed}:reviews:{wine_ids[0]}")
+    rows = []
+    for wine_id, count in zip(wine_ids, review_counts):
+        quality = rng.uniform(3, 9)
+        for user_index in rng.sample(range(len(user_ids)), min(count, len(user_ids))):
+            created = created_from + timedelta(seconds=rng.randint(0, 5 * 365 * 86400))
+            rating = max(0, min(10, round(rng.gauss(quality, 1.5))))
+            rows.append((wine_id, user_ids[user_index], rating, "", created.isoformat()))
+    copy_rows(WineReview, ["wine_id", "user_id", "rating", "comment", "created_at"], rows)
+    return len(rows)
+
+
+def write_saved_wines(seed, user_ids, wine_ids, cum_weights, average):
+    rng = random.Random(f"{seed}:saved:{user_ids[0]}")
+    rows = []
+    for user_id in user_ids:
+        count = min(len(wine_ids), int(rng.expovariate(1 / average)) if average else 0)
+        saved = set(rng.choices(wine_ids, cum_weights=cum_weights, k=count))
+        rows.extend((user_id, wine_id) for wine_id in saved)
+    copy_rows(SavedWine, ["user_id", "wine_id"], rows)
+    return len(rows)
+
+
+class Command(BaseCommand):
+    """Django command to generate a large, realistic, reproducible catalog."""
+
+    help = "Seed wines, users, reviews and saved wines with realistic distributions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wines", type=int, default=10_000)
+        parser.add_argument("--reviews", type=int, default=100_000)
+        parser.add_argument("--users", type=int, default=5_000)
+        parser.add_argument("--saved-per-user", type=float, default=8.0)
+        parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducible data")
+        parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        seed = options["seed"]
+        batch_size = options["batch_size"]
+        five_years_ago = datetime.now(timezone.utc) - timedelta(days=5 * 365)
+
+        user_offset = (User.objects.aggregate(max_id=Max("id"))["max_id"] or 0) + 1
+        # ids of deleted wines stay in the change feed and are not reused
+        wine_offset = max(
+            Wine.objects.aggregate(max_id=Max("id"))["max_id"] or 0,
+            WineChange.objects.aggregate(max_id=Max("wine_id"))["max_id"] or 0,
+        ) + 1
+
+        password = make_password("seedpassword")
+        dimension_ids = resolve_dimensions()
+        self.run_phase(
+            "users",
+            [
+                (write_users, (seed, start, min(start + batch_size, user_offset + options["users"]),
+                               password, five_years_ago))
+                for start in range(user_offset, user_offset + options["users"], batch_size)
+            ],
+            options["workers"],
+        )
+        self.run_phase(
+            "wines",
+            [
+                (write_wines, (seed, start, min(start + batch_size, wine_offset + options["wines"]),
+                               dimension_ids))
+                for start in range(wine_offset, wine_offset + options["wines"], batch_size)
+            ],
+            options["workers"],
+        )
+
+        with connection.cursor() as cursor:
+            # wines are written with explicit ids, so their blends can be written in the same task
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{Wine._meta.db_table}', 'id'), MAX(id)) "
+                f"FROM {Wine._meta.db_table}"
+            )
+        user_ids = list(User.objects.filter(id__gte=user_offset).values_list("id", flat=True))
+        wine_ids = list(Wine.objects.filter(id__gte=wine_offset).values_list("id", flat=True))
+        # COPY bypasses the signals that feed sync clients
+        WineChange.objects.record(wine_ids, WineChange.CREATED)
+        if not user_ids or not wine_ids:
+            return
+
+        # skewed popularity: a few wines get most of the reviews and saves
+        rng = random.Random(f"{seed}:popularity")
+        weights = zipf_weights(len(wine_ids))
+        rng.shuffle(weights)
+        review_counts = self.allocate_reviews(weights, options["reviews"], len(user_ids), rng)
+
+        self.run_phase(
+            "reviews",
+            [
+                (write_reviews, (seed, wine_ids[start:start + REVIEW_CHUNK],
+                                 review_counts[start:start + REVIEW_CHUNK], user_ids, five_years_ago))
+                for start in range(0, len(wine_ids), REVIEW_CHUNK)
+            ],
+            options["workers"],
+        )
+        cum_weights = list(itertools.accumulate(weights))
+        self.run_phase(
+            "saved wines",
+            [
+                (write_saved_wines, (seed, user_ids[start:start + batch_size], wine_ids,
+                                     cum_weights, options["saved_per_user"]))
+                for start in range(0, len(user_ids), batch_size)
+            ],
+            options["workers"],
+        )
+        # COPY bypasses the m2m and review signals that maintain saved_count and average_rating
+        seeded = Wine.objects.filter(id__gte=wine_offset)
+        Wine.objects.reconcile_saved_counts(seeded)
+        Wine.objects.refresh_ratings(seeded)
+        with connection.cursor() as cursor:
+            for model in (User, Wine, WineGrape, WineReview, SavedWine, WineChange):
+                cursor.execute(f"ANALYZE {model._meta.db_table}")
+        self.stdout.write(self.style.SUCCESS("Catalog seeded!"))
+
+    @staticmethod
+    def allocate_reviews(weights, reviews, max_per_wine, rng):
+        """Split reviews across wines by weight, capped at one review per user."""
+        counts = [0] * len(weights)
+        open_wines = list(range(len(weights)))
+        remaining = min(reviews, max_per_wine * len(weights))
+        while remaining > 0 and open_wines:
+            total = sum(weights[index] for index in open_wines)
+            still_open = []
+            allocated = 0
+            for index in open_wines:
+                expected = weights[index] / total * remaining
+                count = min(max_per_wine - counts[index], int(expected) + (rng.random() < expected % 1))
+                counts[index] += count
+                allocated += count
+                if counts[index] < max_per_wine:
+                    still_open.append(index)
+            remaining -= allocated
+            open_wines = still_open
+            if not allocated:
+                break
+        return counts
+
+    def run_phase(self, name, tasks, workers):
+        started = time.perf_counter()
+        if workers > 1 and len(tasks) > 1 and not connection.in_atomic_block:
+            # forked workers must not share the parent's database connection
+            connections.close_all()
+            with multiprocessing.get_context("fork").Pool(workers) as pool:
+                results = pool.map(run_task, tasks)
+        else:
+            results = [function(*args) for function, args in tasks]
+        written = sum(results)
+        self.stdout.write(f"Seeded {written} {name} in {time.perf_counter() - started:.1f}s")
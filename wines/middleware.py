@@ -0,0 +1,82 @@
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+
+from wine_library.metrics import view_label
+from wines.models import SlowQuery
+
+# query params that select output rather than filter the catalog
+NON_FILTER_PARAMS = {"format", "page", "page_size"}
+
+
+def filter_signature(request):
+    """Normalized ``View.action?param,param`` key, independent of param values."""
+    params = sorted(set(request.GET) - NON_FILTER_PARAMS)
+    return f"{view_label(request)}?{','.join(params)}"
+
+
+class SlowQueryMiddleware:
+    """Capture slow SELECTs with ``EXPLAIN (ANALYZE, BUFFERS)`` output.
+
+    Opt-in through ``SLOW_QUERY_RECORDER``. Requests are sampled and each
+    filter signature is recorded at most once per ``interval`` seconds, since
+    explaining re-runs the query. Every database alias is watched, and a
+    query is explained on the replica or primary that ran it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = settings.SLOW_QUERY_RECORDER
+        if not config["enabled"] or random.random() >= config["sample_rate"]:
+            return self.get_response(request)
+
+        slow_queries = []
+        threshold = config["threshold_ms"] / 1000
+
+        def record(execute, sql, params, many, context):
+            started = time.perf_counter()
+            result = execute(sql, params, many, context)
+            duration = time.perf_counter() - started
+            if duration >= threshold and not many and sql.lstrip().upper().startswith("SELECT"):
+                slow_queries.append((duration, context["connection"].alias, sql, params))
+            return result
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(record))
+            response = self.get_response(request)
+
+        if slow_queries and response.status_code < 500:
+            self.store(request, max(slow_queries, key=lambda query: query[0]), config["interval"])
+        return response
+
+    def store(self, request, slow_query, interval):
+        signature = filter_signature(request)
+        if not cache.add(f"slow-query:{signature}", 1, timeout=interval):
+            return
+
+        duration, alias, sql, params = slow_query
+        connection = connections[alias]
+        try:
+            with transaction.atomic(using=alias), connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+                plan = "\n".join(row[0] for row in cursor.fetchall())
+        except DatabaseError:
+            plan = ""
+
+        with connection.cursor() as cursor:
+            full_sql = cursor.mogrify(sql, params).decode()
+        SlowQuery.objects.create(
+            view=view_label(request),
+            path=request.get_full_path()[:255],
+            filter_signature=signature[:255],
+            sql=full_sql,
+            duration_ms=duration * 1000,
+            plan=plan,
+        )
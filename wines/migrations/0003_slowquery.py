@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0002_alter_winereview_rating"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlowQuery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("view", models.CharField(max_length=100)),
+                ("path", models.CharField(max_length=255)),
+                ("filter_signature", models.CharField(db_index=True, max_length=255)),
+                ("sql", models.TextField()),
+                ("duration_ms", models.FloatField()),
+                ("plan", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name_plural": "slow queries",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0003_slowquery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wine",
+            name="vintage_year",
+            field=models.PositiveSmallIntegerField(
+                blank=True, db_index=True, editable=False, null=True
+            ),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE wines_wine
+                SET vintage_year = CAST(TRIM(vintage) AS integer)
+                WHERE TRIM(vintage) ~ '^[0-9]{1,4}$'
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
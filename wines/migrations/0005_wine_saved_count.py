@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0004_wine_vintage_year"),
+        ("user", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wine",
+            name="saved_count",
+            field=models.PositiveIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE wines_wine
+                SET saved_count = saved.count
+                FROM (
+                    SELECT wine_id, COUNT(*) AS count
+                    FROM user_user_saved_wines
+                    GROUP BY wine_id
+                ) AS saved
+                WHERE wines_wine.id = saved.wine_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
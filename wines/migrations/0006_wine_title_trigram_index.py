@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+def create_title_trigram_index(apps, schema_editor):
+    """Index UPPER(title) for the ``icontains`` searches of the admin and the API.
+
+    Skipped on servers built without the pg_trgm contrib extension, where
+    title searches keep working as sequential scans.
+    """
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS wines_wine_title_upper_trgm "
+        "ON wines_wine USING gin (UPPER(title) gin_trgm_ops)"
+    )
+
+
+def drop_title_trigram_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS wines_wine_title_upper_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0005_wine_saved_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_title_trigram_index, drop_title_trigram_index),
+    ]
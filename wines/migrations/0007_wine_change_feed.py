@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-19 12:43
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0006_wine_title_trigram_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wine",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name="WineChange",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("wine_id", models.BigIntegerField()),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("created", "Created"),
+                            ("updated", "Updated"),
+                            ("deleted", "Deleted"),
+                            ("purged", "Purged"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "txid",
+                    models.BigIntegerField(
+                        db_default=django.db.models.expressions.RawSQL(
+                            "pg_current_xact_id()::text::bigint", ()
+                        )
+                    ),
+                ),
+                ("changed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["txid", "id"], name="wine_change_cursor"),
+                    models.Index(fields=["wine_id"], name="wine_change_wine"),
+                ],
+            },
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO wines_winechange (wine_id, action, changed_at)
+                SELECT id, 'created', now() FROM wines_wine ORDER BY id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
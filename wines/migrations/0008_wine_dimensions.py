@@ -0,0 +1,138 @@
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FIELDS = {
+    "wine_type": "WineType",
+    "country": "Country",
+    "region": "Region",
+    "grape": "Grape",
+    "style": "Style",
+}
+
+# the lookup keys as of this migration, copied so later changes to wines.models leave it alone
+ALIASES = {
+    "Country": {
+        "us": "usa",
+        "u s a": "usa",
+        "united states": "usa",
+        "united states of america": "usa",
+        "uk": "united kingdom",
+        "great britain": "united kingdom",
+    },
+}
+
+
+def canonical_key(model_name, name):
+    """Lowercase, accent and punctuation free, single-spaced key of a name, with aliases resolved."""
+    value = unicodedata.normalize("NFKD", name or "")
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    key = " ".join(re.sub(r"[^\w]+", " ", value.casefold()).split())
+    aliases = ALIASES.get(model_name, {})
+    return aliases.get(key, key)
+
+
+def dimension_model(name, options=None):
+    return migrations.CreateModel(
+        name=name,
+        fields=[
+            ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+            ("name", models.CharField(max_length=100)),
+            ("key", models.CharField(editable=False, max_length=100, unique=True)),
+        ],
+        options={"ordering": ["name"], "abstract": False, **(options or {})},
+    )
+
+
+def check_constraints(schema_editor):
+    # run the deferred foreign key checks now, the following ALTER TABLEs refuse pending ones
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+
+
+def move_to_dimensions(apps, schema_editor):
+    """Deduplicate the distinct values of every field into its lookup table and point wines at it."""
+    Wine = apps.get_model("wines", "Wine")
+    for field, model_name in FIELDS.items():
+        model = apps.get_model("wines", model_name)
+        spellings = defaultdict(Counter)
+        values = Wine.objects.values_list(f"{field}_name").annotate(count=models.Count("id")).order_by()
+        for raw, count in values:
+            key = canonical_key(model_name, raw)
+            if key:
+                spellings[key][raw] += count
+
+        entries = model.objects.bulk_create(
+            [
+                # the most used spelling becomes the canonical name
+                model(key=key, name=" ".join(min(counts, key=lambda raw: (-counts[raw], raw)).split()))
+                for key, counts in spellings.items()
+            ]
+        )
+        ids = {entry.key: entry.id for entry in entries}
+        mapping = [(raw, ids[key]) for key, counts in spellings.items() for raw in counts]
+        if not mapping:
+            continue
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {Wine._meta.db_table} AS wine SET {field}_id = mapping.id
+                FROM (VALUES {", ".join(["(%s, %s)"] * len(mapping))}) AS mapping (raw, id)
+                WHERE wine.{field}_name = mapping.raw
+                """,
+                [value for pair in mapping for value in pair],
+            )
+    check_constraints(schema_editor)
+
+
+def move_from_dimensions(apps, schema_editor):
+    Wine = apps.get_model("wines", "Wine")
+    with schema_editor.connection.cursor() as cursor:
+        for field, model_name in FIELDS.items():
+            table = apps.get_model("wines", model_name)._meta.db_table
+            cursor.execute(
+                f"""
+                UPDATE {Wine._meta.db_table} AS wine SET {field}_name = dimension.name
+                FROM {table} AS dimension WHERE wine.{field}_id = dimension.id
+                """
+            )
+    check_constraints(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0007_wine_change_feed"),
+    ]
+
+    operations = [
+        dimension_model("Country", {"verbose_name_plural": "countries"}),
+        dimension_model("Grape"),
+        dimension_model("Region"),
+        dimension_model("Style"),
+        dimension_model("WineType"),
+        *[
+            migrations.RenameField(model_name="wine", old_name=field, new_name=f"{field}_name")
+            for field in FIELDS
+        ],
+        *[
+            migrations.AddField(
+                model_name="wine",
+                name=field,
+                field=models.ForeignKey(
+                    blank=True,
+                    null=True,
+                    on_delete=django.db.models.deletion.PROTECT,
+                    related_name="wines",
+                    to=f"wines.{model_name.lower()}",
+                ),
+            )
+            for field, model_name in FIELDS.items()
+        ],
+        migrations.RunPython(move_to_dimensions, move_from_dimensions),
+        *[migrations.RemoveField(model_name="wine", name=f"{field}_name") for field in FIELDS],
+    ]
@@ -0,0 +1,151 @@
+import re
+import unicodedata
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+# "Merlot/Cabernet Franc", "Syrah, Grenache", "Shiraz & Viognier" are blends of free text grapes
+BLEND_SEPARATOR = re.compile(r"\s*(?:[/,+&]|\band\b)\s*", re.IGNORECASE)
+
+
+def canonical_key(name):
+    """Grape key as of this migration: lowercase, accent and punctuation free, single-spaced."""
+    value = unicodedata.normalize("NFKD", name or "")
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[^\w]+", " ", value.casefold()).split())
+
+
+def check_constraints(schema_editor):
+    # run the deferred foreign key checks now, the following ALTER TABLEs refuse pending ones
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+
+
+def split_blends(apps, schema_editor):
+    """Move every wine's grape into its blend, splitting free text blends into their grapes."""
+    Grape = apps.get_model("wines", "Grape")
+    grapes = {grape.key: grape for grape in Grape.objects.all()}
+    blends = {}
+    for grape in list(grapes.values()):
+        parts = [part for part in BLEND_SEPARATOR.split(grape.name) if part]
+        if len(parts) < 2:
+            continue
+        blend = []
+        for part in parts:
+            key = canonical_key(part)
+            if key not in grapes:
+                grapes[key] = Grape.objects.create(name=" ".join(part.split()), key=key)
+            if grapes[key].id not in blend:
+                blend.append(grapes[key].id)
+        blends[grape.id] = blend
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO wines_winegrape (wine_id, grape_id)
+            SELECT id, grape_id FROM wines_wine
+            WHERE grape_id IS NOT NULL AND grape_id <> ALL(%s)
+            """,
+            [list(blends)],
+        )
+        for blend_id, grape_ids in blends.items():
+            cursor.execute(
+                """
+                INSERT INTO wines_winegrape (wine_id, grape_id)
+                SELECT wine.id, grape.id FROM wines_wine AS wine
+                CROSS JOIN unnest(%s::bigint[]) WITH ORDINALITY AS grape (id, position)
+                WHERE wine.grape_id = %s
+                ORDER BY wine.id, grape.position
+                """,
+                [grape_ids, blend_id],
+            )
+        cursor.execute("UPDATE wines_wine SET grape_id = NULL WHERE grape_id = ANY(%s)", [list(blends)])
+    Grape.objects.filter(id__in=list(blends)).delete()
+    check_constraints(schema_editor)
+
+
+def keep_main_grape(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE wines_wine AS wine SET grape_id = blend.grape_id
+            FROM (
+                SELECT DISTINCT ON (wine_id) wine_id, grape_id FROM wines_winegrape
+                ORDER BY wine_id, percentage DESC NULLS LAST, id
+            ) AS blend
+            WHERE wine.id = blend.wine_id
+            """
+        )
+    check_constraints(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0008_wine_dimensions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WineGrape",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "percentage",
+                    models.PositiveSmallIntegerField(
+                        blank=True,
+                        help_text="Share of the blend in percent, empty if unknown",
+                        null=True,
+                        validators=[
+                            django.core.validators.MinValueValidator(1),
+                            django.core.validators.MaxValueValidator(100),
+                        ],
+                    ),
+                ),
+                (
+                    "grape",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="wine_grapes",
+                        to="wines.grape",
+                    ),
+                ),
+                (
+                    "wine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="blend",
+                        to="wines.wine",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": [models.OrderBy(models.F("percentage"), descending=True, nulls_last=True), "id"],
+                "indexes": [models.Index(fields=["grape", "wine"], name="wine_grape_membership")],
+                "constraints": [models.UniqueConstraint(fields=("wine", "grape"), name="unique_wine_grape")],
+            },
+        ),
+        # free the "wines" accessor of Grape for the blend while both fields exist
+        migrations.AlterField(
+            model_name="wine",
+            name="grape",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="wines.grape",
+            ),
+        ),
+        migrations.AddField(
+            model_name="wine",
+            name="grapes",
+            field=models.ManyToManyField(
+                blank=True, related_name="wines", through="wines.WineGrape", to="wines.grape"
+            ),
+        ),
+        migrations.RunPython(split_blends, keep_main_grape),
+        migrations.RemoveField(model_name="wine", name="grape"),
+    ]
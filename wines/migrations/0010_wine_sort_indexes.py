@@ -0,0 +1,111 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0009_wine_grape_blend"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wine",
+            name="average_rating",
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE wines_wine
+                SET average_rating = reviews.average
+                FROM (
+                    SELECT wine_id, AVG(rating) AS average
+                    FROM wines_winereview
+                    GROUP BY wine_id
+                ) AS reviews
+                WHERE wines_wine.id = reviews.wine_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name="wine",
+            name="saved_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name="wine",
+            name="vintage_year",
+            field=models.PositiveSmallIntegerField(
+                blank=True, editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(fields=["price", "id"], name="wine_price_asc"),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(
+                models.OrderBy(models.F("price"), descending=True, nulls_last=True),
+                models.OrderBy(models.F("id"), descending=True),
+                name="wine_price_desc",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(fields=["abv", "id"], name="wine_abv_asc"),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(
+                models.OrderBy(models.F("abv"), descending=True, nulls_last=True),
+                models.OrderBy(models.F("id"), descending=True),
+                name="wine_abv_desc",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(
+                fields=["vintage_year", "id"], name="wine_vintage_year_asc"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(
+                models.OrderBy(
+                    models.F("vintage_year"), descending=True, nulls_last=True
+                ),
+                models.OrderBy(models.F("id"), descending=True),
+                name="wine_vintage_year_desc",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(
+                fields=["average_rating", "id"], name="wine_average_rating_asc"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(
+                models.OrderBy(
+                    models.F("average_rating"), descending=True, nulls_last=True
+                ),
+                models.OrderBy(models.F("id"), descending=True),
+                name="wine_average_rating_desc",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(
+                fields=["saved_count", "id"], name="wine_saved_count_sort"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="wine",
+            index=models.Index(
+                fields=["updated_at", "id"], name="wine_updated_at_sort"
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wines", "0010_wine_sort_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="winereview",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="review_user_history"
+            ),
+        ),
+        # the new index leads with user_id and replaces the foreign key's own index
+        migrations.AlterField(
+            model_name="winereview",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -1,13 +1,40 @@
 import os
+import re
+import unicodedata
 import uuid
 
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.db import connections, models, transaction
+from django.db.models import Avg, Count, F, OuterRef, Q, Subquery, UniqueConstraint, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
 
 
+NON_VINTAGE = "NV"
+
+
+def is_ascii_digits(value):
+    """Whether ``int()`` parses the value as a plain number (``str.isdigit`` also accepts "²")."""
+    return value.isascii() and value.isdigit()
+
+
+def parse_vintage_year(vintage):
+    """Year of a vintage label, ``None`` for non-vintage ("NV") or blank wines."""
+    vintage = (vintage or "").strip()
+    return int(vintage) if is_ascii_digits(vintage) else None
+
+
+def normalize_name(value):
+    """Lowercase, accent-free, single-spaced form of a name."""
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(value.casefold().split())
+
+
 def wine_image_file_path(instance, filename):
     _, extension = os.path.splitext(filename)
     filename = f"{slugify(instance.title)}-{uuid.uuid4()}{extension}"
@@ -15,34 +42,316 @@ def wine_image_file_path(instance, filename):
     return os.path.join("uploads/wines/", filename)
 
 
+class DimensionManager(models.Manager):
+    def resolve(self, name):
+        """The entry ``name`` canonicalizes to, created if new. ``None`` for a blank name."""
+        key = self.model.canonical_key(name)
+        if not key:
+            return None
+        entry, _ = self.get_or_create(key=key, defaults={"name": " ".join(name.split())})
+        return entry
+
+    def lookup(self, name):
+        """Like ``resolve`` without writing: a new name gives an unsaved entry, see ``save_new_dimensions``."""
+        key = self.model.canonical_key(name)
+        if not key:
+            return None
+        entry = self.filter(key=key).first()
+        return entry or self.model(key=key, name=" ".join(name.split()))
+
+    def ids_matching(self, name, contains=False):
+        """Ids of the entries equal to, or containing, ``name`` once canonicalized."""
+        return self.ids_matching_each([name], contains)[0]
+
+    def ids_matching_each(self, names, contains=False):
+        """``ids_matching`` of every name, with a single query."""
+        keys = [self.model.canonical_key(name) for name in names]
+        lookup = "key__contains" if contains else "key"
+        condition = Q()
+        for key in keys:
+            condition |= Q(**{lookup: key})
+        entries = self.filter(condition).order_by().values_list("id", "key")
+        return [
+            [pk for pk, entry_key in entries if (key in entry_key if contains else key == entry_key)]
+            for key in keys
+        ]
+
+
+def save_new_dimensions(entries):
+    """Create the unsaved entries returned by ``lookup`` in place, reusing ones created meanwhile."""
+    for entry in entries:
+        if entry is not None and entry._state.adding:
+            stored = type(entry).objects.resolve(entry.name)
+            entry.pk, entry.name = stored.pk, stored.name
+            entry._state.adding, entry._state.db = False, stored._state.db
+
+
+class Dimension(models.Model):
+    """A canonical value shared by many wines, such as a country or a grape.
+
+    Spelling variants that only differ in case, accents, punctuation or a
+    known alias share one ``key`` and therefore one row.
+    """
+
+    # canonical key -> key of the preferred spelling
+    ALIASES = {}
+
+    name = models.CharField(max_length=100)
+    key = models.CharField(max_length=100, unique=True, editable=False)
+
+    objects = DimensionManager()
+
+    class Meta:
+        abstract = True
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def canonical_key(cls, name):
+        key = " ".join(re.sub(r"[^\w]+", " ", normalize_name(name)).split())
+        return cls.ALIASES.get(key, key)
+
+    def clean(self):
+        duplicate = type(self).objects.filter(key=self.canonical_key(self.name)).exclude(pk=self.pk).first()
+        if duplicate is not None:
+            raise ValidationError({"name": f"Same as the existing {duplicate.name!r}."})
+
+    def save(self, *args, **kwargs):
+        self.key = self.canonical_key(self.name)
+        super().save(*args, **kwargs)
+
+
+class Country(Dimension):
+    ALIASES = {
+        "us": "usa",
+        "u s a": "usa",
+        "united states": "usa",
+        "united states of america": "usa",
+        "uk": "united kingdom",
+        "great britain": "united kingdom",
+    }
+
+    class Meta(Dimension.Meta):
+        verbose_name_plural = "countries"
+
+
+class Region(Dimension):
+    pass
+
+
+class Grape(Dimension):
+    pass
+
+
+class WineType(Dimension):
+    pass
+
+
+class Style(Dimension):
+    pass
+
+
+# Wine foreign keys to the lookup tables above; grapes are a blend, see WineGrape
+DIMENSIONS = {
+    "wine_type": WineType,
+    "country": Country,
+    "region": Region,
+    "style": Style,
+}
+
+
+class WineManager(models.Manager):
+    def save_for(self, wine, user):
+        """Add the wine to the user's saved list, counting it only if it was not saved yet.
+
+        Returns whether the wine was newly saved.
+        """
+        through = self.model.saved_by_users.through
+        with transaction.atomic(using=self.db), connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {through._meta.db_table} (user_id, wine_id)
+                VALUES (%s, %s)
+                ON CONFLICT (user_id, wine_id) DO NOTHING
+                """,
+                [user.pk, wine.pk],
+            )
+            saved = cursor.rowcount == 1
+            if saved:
+                self.filter(pk=wine.pk).update(saved_count=F("saved_count") + 1)
+        return saved
+
+    def unsave_for(self, wine, user):
+        """Remove the wine from the user's saved list. Returns whether it was saved."""
+        through = self.model.saved_by_users.through
+        with transaction.atomic(using=self.db):
+            removed, _ = through.objects.using(self.db).filter(user_id=user.pk, wine_id=wine.pk).delete()
+            if removed:
+                self.filter(pk=wine.pk).update(saved_count=F("saved_count") - 1)
+        return bool(removed)
+
+    def reconcile_saved_counts(self, queryset=None):
+        """Recount ``saved_count`` from the saved wines table. Returns the number of wines fixed."""
+        through = self.model.saved_by_users.through
+        actual = Coalesce(
+            Subquery(
+                through.objects.filter(wine_id=OuterRef("pk"))
+                .order_by()
+                .values("wine_id")
+                .annotate(count=Count("*"))
+                .values("count")
+            ),
+            Value(0),
+        )
+        queryset = self.all() if queryset is None else queryset
+        return queryset.exclude(saved_count=actual).update(saved_count=actual)
+
+    def refresh_ratings(self, queryset=None):
+        """Recompute ``average_rating`` from the reviews. Returns the number of wines updated."""
+        average = Subquery(
+            WineReview.objects.filter(wine_id=OuterRef("pk"))
+            .order_by()
+            .values("wine_id")
+            .annotate(average=Avg("rating"))
+            .values("average")
+        )
+        queryset = self.all() if queryset is None else queryset
+        return queryset.update(average_rating=average)
+
+
+def sort_indexes(field):
+    """Indexes serving ``?ordering`` on a nullable field both ways, empty values last."""
+    return [
+        models.Index(fields=[field, "id"], name=f"wine_{field}_asc"),
+        models.Index(F(field).desc(nulls_last=True), F("id").desc(), name=f"wine_{field}_desc"),
+    ]
+
+
 class Wine(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     price = models.FloatField(null=True, blank=True)
-    wine_type = models.CharField(max_length=100, blank=True)
+    wine_type = models.ForeignKey(
+        WineType, null=True, blank=True, on_delete=models.PROTECT, related_name="wines"
+    )
     abv = models.FloatField(null=True, blank=True)
     vintage = models.CharField(max_length=50, blank=True)
-    country = models.CharField(max_length=100, blank=True)
-    region = models.CharField(max_length=100, blank=True)
-    grape = models.CharField(max_length=100, blank=True)
+    vintage_year = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    country = models.ForeignKey(
+        Country, null=True, blank=True, on_delete=models.PROTECT, related_name="wines"
+    )
+    region = models.ForeignKey(
+        Region, null=True, blank=True, on_delete=models.PROTECT, related_name="wines"
+    )
+    grapes = models.ManyToManyField(Grape, through="WineGrape", blank=True, related_name="wines")
     characteristics = models.TextField(blank=True)
-    style = models.CharField(max_length=100, blank=True)
+    style = models.ForeignKey(
+        Style, null=True, blank=True, on_delete=models.PROTECT, related_name="wines"
+    )
     capacity = models.FloatField(null=True, blank=True)
     image = models.ImageField(null=True, blank=True, upload_to=wine_image_file_path)
+    # number of users that saved the wine, kept in sync with User.saved_wines
+    saved_count = models.PositiveIntegerField(default=0, editable=False)
+    # mean rating of the reviews, kept in sync with WineReview
+    average_rating = models.FloatField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = WineManager()
 
     def __str__(self):
         return f"{self.title} ({self.vintage})" if self.vintage else self.title
 
+    def save(self, *args, **kwargs):
+        self.vintage_year = parse_vintage_year(self.vintage)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "vintage" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "vintage_year"}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ["title"]
         constraints = [
             UniqueConstraint(fields=["title", "vintage", "capacity"], name="unique_wine_entry")
         ]
+        # one per ?ordering of the list, id breaks ties
+        indexes = [
+            *sort_indexes("price"),
+            *sort_indexes("abv"),
+            *sort_indexes("vintage_year"),
+            *sort_indexes("average_rating"),
+            models.Index(fields=["saved_count", "id"], name="wine_saved_count_sort"),
+            models.Index(fields=["updated_at", "id"], name="wine_updated_at_sort"),
+        ]
+
+
+class WineGrapeManager(models.Manager):
+    def set_blends(self, blends):
+        """Replace wines' blends, given as ``(wine, [{"grape": ..., "percentage": ...}])`` pairs."""
+        blends = list(blends)
+        self.filter(wine__in=[wine.pk for wine, _ in blends]).delete()
+        self.bulk_create(
+            [self.model(wine=wine, **entry) for wine, entries in blends for entry in entries]
+        )
+
+
+class WineGrape(models.Model):
+    """Share of a grape in a wine's blend, largest first."""
+
+    wine = models.ForeignKey(Wine, on_delete=models.CASCADE, related_name="blend")
+    grape = models.ForeignKey(Grape, on_delete=models.PROTECT, related_name="wine_grapes")
+    percentage = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        help_text="Share of the blend in percent, empty if unknown",
+    )
+
+    objects = WineGrapeManager()
+
+    class Meta:
+        ordering = [F("percentage").desc(nulls_last=True), "id"]
+        constraints = [UniqueConstraint(fields=["wine", "grape"], name="unique_wine_grape")]
+        # wines having a grape, read from the index alone
+        indexes = [models.Index(fields=["grape", "wine"], name="wine_grape_membership")]
+
+    def __str__(self):
+        share = f"{self.percentage}% " if self.percentage else ""
+        return f"{share}{self.grape}"
+
+
+class WineReviewManager(models.Manager):
+    def upsert(self, wine, user, rating, comment=""):
+        """Create or update the user's review of the wine in a single statement.
+
+        Returns ``(review, created)``.
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.model._meta.db_table} (wine_id, user_id, rating, comment, created_at)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (wine_id, user_id)
+                DO UPDATE SET rating = EXCLUDED.rating, comment = EXCLUDED.comment
+                RETURNING id, created_at, (xmax = 0)
+                """,
+                [wine.pk, user.pk, rating, comment, timezone.now()],
+            )
+            pk, created_at, created = cursor.fetchone()
+
+        review = self.model(
+            id=pk, wine=wine, user=user, rating=rating, comment=comment, created_at=created_at
+        )
+        review._state.adding = False
+        review._state.db = self.db
+        return review, created
 
 
 class WineReview(models.Model):
     wine = models.ForeignKey(Wine, on_delete=models.CASCADE, related_name="reviews")
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # indexed by review_user_history
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
     rating = models.PositiveSmallIntegerField(
         validators=[MinValueValidator(0), MaxValueValidator(10)],
         help_text="Оцінка від 0 до 10",
@@ -50,9 +359,118 @@ class WineReview(models.Model):
     comment = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = WineReviewManager()
+
     class Meta:
         unique_together = ("wine", "user")  # only one review per wine per user
         ordering = ["-created_at"]
+        # a user's reviews newest first, the keyset of their review history pages
+        indexes = [models.Index(fields=["user", "-created_at", "-id"], name="review_user_history")]
+
+    def __str__(self):
+        return f"{self.user.email} – {self.wine.title}: {self.rating}"
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        # queryset deletes and cascades skip this, so they can delete without loading rows;
+        # their callers refresh the ratings of all affected wines in one UPDATE
+        Wine.objects.refresh_ratings(Wine.objects.filter(pk=self.wine_id))
+        return result
+
+
+class SlowQuery(models.Model):
+    """A sampled slow query with its execution plan, see SlowQueryMiddleware."""
+
+    view = models.CharField(max_length=100)
+    path = models.CharField(max_length=255)
+    filter_signature = models.CharField(max_length=255, db_index=True)
+    sql = models.TextField()
+    duration_ms = models.FloatField()
+    plan = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name_plural = "slow queries"
+
+    def __str__(self):
+        return f"{self.filter_signature}: {self.duration_ms:.0f}ms"
+
+
+class WineChangeManager(models.Manager):
+    def record(self, wine_ids, action):
+        self.bulk_create(
+            [self.model(wine_id=wine_id, action=action) for wine_id in wine_ids], batch_size=5000
+        )
+
+    def since(self, cursor, limit):
+        """Changes after ``cursor`` in commit-safe order.
+
+        ``cursor`` is a ``(txid, id)`` pair. Only changes of transactions older
+        than the oldest one still running are returned: they can no longer be
+        joined by rows with lower ids, so the cursor never skips a change that
+        commits late. Returns ``(changes, next_cursor, has_more)``.
+        """
+        with connections[self.db].cursor() as db_cursor:
+            db_cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+            xmin = db_cursor.fetchone()[0]
+
+        txid, change_id = cursor
+        changes = list(
+            self.filter(Q(txid__gt=txid) | Q(txid=txid, id__gt=change_id), txid__lt=xmin)
+            .exclude(action=self.model.PURGED)
+            .order_by("txid", "id")[: limit + 1]
+        )
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if has_more:
+            next_cursor = (changes[-1].txid, changes[-1].id)
+        else:
+            # every transaction before xmin has been returned
+            next_cursor = max(cursor, (xmin, 0))
+        return changes, next_cursor, has_more
+
+    def is_expired(self, cursor):
+        """Whether tombstones newer than ``cursor`` have been purged."""
+        txid, change_id = cursor
+        return self.filter(
+            Q(txid__gt=txid) | Q(txid=txid, id__gt=change_id), action=self.model.PURGED
+        ).exists()
+
+
+class WineChange(models.Model):
+    """One entry of the wine change feed, see ``WineChangeFeedView``.
+
+    Superseded entries are compacted and tombstones expire after
+    ``CHANGE_FEED["retention_days"]``; a ``purged`` marker tells clients
+    with older cursors to resync.
+    """
+
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    PURGED = "purged"
+    ACTION_CHOICES = [
+        (CREATED, "Created"),
+        (UPDATED, "Updated"),
+        (DELETED, "Deleted"),
+        (PURGED, "Purged"),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    wine_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # id of the writing transaction, orders the feed by commit visibility
+    txid = models.BigIntegerField(db_default=RawSQL("pg_current_xact_id()::text::bigint", ()))
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    objects = WineChangeManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["txid", "id"], name="wine_change_cursor"),
+            models.Index(fields=["wine_id"], name="wine_change_wine"),
+        ]
 
     def __str__(self):
-        return f"{self.user.username} – {self.wine.title}: {self.rating}"
+        return f"{self.action} wine {self.wine_id}"
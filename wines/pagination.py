@@ -0,0 +1,146 @@
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from wine_library.singleflight import queryset_key, single_flight
+
+
+def table_estimate(model, using="default"):
+    """Planner estimate of the number of rows in the model's table (``pg_class.reltuples``)."""
+
+    def fetch():
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # -1 until the table has been vacuumed or analyzed
+        return max(row[0], 0) if row else 0
+
+    return cache.get_or_set(
+        f"table-estimate:{using}:{model._meta.db_table}",
+        fetch,
+        timeout=settings.ESTIMATED_COUNT["table_estimate_timeout"],
+    )
+
+
+def query_estimate(queryset):
+    """Planner estimate of the number of rows the queryset returns (EXPLAIN row estimate)."""
+    plan = queryset.order_by().explain(format="json")
+    # nothing to explain when a filter can match no rows, e.g. an empty id list
+    if not plan:
+        return 0
+    return json.loads(plan)[0]["Plan"]["Plan Rows"]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that reports planner estimates instead of ``COUNT(*)`` for large results.
+
+    Unfiltered querysets use the table estimate, filtered ones the EXPLAIN row
+    estimate. Results estimated at or below ``ESTIMATED_COUNT["threshold"]``
+    rows are still counted exactly; ``count_is_estimated`` tells which one
+    ``count`` is. Page numbers are never checked against the count: a page
+    fetches one row more than it shows to know whether a next page exists,
+    and only a page without rows is out of range.
+
+    Concurrent requests for the same count or page share one execution of
+    its query, keyed by its SQL (see ``wine_library.singleflight``). Counts
+    leave annotations out of the key; pages are shared with everyone running
+    the same SQL, so per-user values belong after the fetch.
+    """
+
+    count_is_estimated = False
+
+    @cached_property
+    def count(self):
+        count, self.count_is_estimated = single_flight(
+            f"count:{queryset_key(self.object_list.order_by().values('pk'))}", self.estimate_count
+        )
+        return count
+
+    def estimate_count(self):
+        """``(count, is_estimated)`` of the object list."""
+        queryset = self.object_list
+        if queryset.query.where:
+            estimate = query_estimate(queryset)
+        else:
+            estimate = table_estimate(queryset.model, queryset.db)
+        if estimate > settings.ESTIMATED_COUNT["threshold"]:
+            return estimate, True
+        return queryset.count(), False
+
+    def validate_number(self, number):
+        """The page number as a positive int, whatever the (possibly underestimated) count."""
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = self.object_list[bottom:bottom + self.per_page + 1]
+        rows = single_flight(f"page:{queryset_key(rows)}", lambda: list(rows))
+        if not rows and (number > 1 or not self.allow_empty_first_page):
+            raise EmptyPage(self.error_messages["no_results"])
+        return LookaheadPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+
+class LookaheadPage(Page):
+    """Page that knows whether a next page exists from the extra row it fetched."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """Page number pagination whose ``count`` may be a planner estimate."""
+
+    django_paginator_class = EstimatedCountPaginator
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "count": self.page.paginator.count,
+                "count_is_estimated": self.page.paginator.count_is_estimated,
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema["properties"]["count_is_estimated"] = {
+            "type": "boolean",
+            "description": "Whether count is a planner estimate rather than an exact count.",
+        }
+        return response_schema
+
+
+class ReviewHistoryPagination(CursorPagination):
+    """Keyset pages of reviews, newest first: each page is an index range scan, however deep."""
+
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
@@ -1,7 +1,82 @@
 from rest_framework import serializers
 from datetime import date
+from django.db import transaction
 
-from wines.models import Wine, WineReview
+from wines.models import (
+    DIMENSIONS, NON_VINTAGE, Country, Grape, Region, Style, Wine, WineGrape, WineReview, WineType,
+    parse_vintage_year, save_new_dimensions,
+)
+
+MAX_BLEND_GRAPES = 20
+
+
+class DimensionField(serializers.Field):
+    """A lookup table entry read and written by name, "" when unset.
+
+    Names are resolved to their canonical entry. Validation does not write:
+    a new name gives an unsaved entry that ``WineSerializer.save_new_dimensions``
+    creates when the wine is written. A ``"dimensions"`` dict in the context
+    memoizes lookups across serializers.
+    """
+
+    default_error_messages = {
+        "invalid": "Not a valid string.",
+        "max_length": "Ensure this field has no more than {max_length} characters.",
+    }
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+        kwargs.setdefault("required", False)
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        entry = super().get_attribute(instance)
+        return "" if entry is None else entry.name
+
+    def to_representation(self, value):
+        return value
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail("invalid")
+        max_length = self.model._meta.get_field("name").max_length
+        if len(data) > max_length:
+            self.fail("max_length", max_length=max_length)
+
+        memo = self.context.get("dimensions")
+        if memo is None:
+            return self.model.objects.lookup(data)
+        key = (self.model, self.model.canonical_key(data))
+        if key not in memo:
+            memo[key] = self.model.objects.lookup(data)
+        return memo[key]
+
+
+class MainGrapeField(DimensionField):
+    """Grape with the largest share of the blend; writing it sets a single grape blend."""
+
+    def __init__(self, **kwargs):
+        super().__init__(Grape, source="*", **kwargs)
+
+    def get_attribute(self, instance):
+        blend = instance.blend.all()
+        return blend[0].grape.name if blend else ""
+
+    def to_internal_value(self, data):
+        return {"main_grape": super().to_internal_value(data)}
+
+
+class WineGrapeSerializer(serializers.ModelSerializer):
+    grape = DimensionField(Grape, required=True)
+
+    class Meta:
+        model = WineGrape
+        fields = ("grape", "percentage")
+
+    def validate_grape(self, value):
+        if value is None:
+            raise serializers.ValidationError("This field may not be blank.")
+        return value
 
 
 class WineReviewSerializer(serializers.ModelSerializer):
@@ -14,34 +89,108 @@ class WineReviewSerializer(serializers.ModelSerializer):
 
 
 class WineSerializer(serializers.ModelSerializer):
+    wine_type = DimensionField(WineType)
+    country = DimensionField(Country)
+    region = DimensionField(Region)
+    grape = MainGrapeField()
+    grapes = WineGrapeSerializer(many=True, required=False, source="blend")
+    style = DimensionField(Style)
+
     class Meta:
         model = Wine
         fields = (
             "id", "title", "description", "price", "wine_type", "abv",
-            "vintage", "country", "region", "grape", "characteristics",
+            "vintage", "country", "region", "grape", "grapes", "characteristics",
             "style", "capacity", "image"
         )
 
+    @staticmethod
+    def pop_blend(validated_data):
+        """Remove the blend from ``validated_data``, ``None`` if it is not changed."""
+        if "main_grape" in validated_data:
+            grape = validated_data.pop("main_grape")
+            return [] if grape is None else [{"grape": grape, "percentage": None}]
+        return validated_data.pop("blend", None)
+
+    @staticmethod
+    def save_new_dimensions(validated_data, blend):
+        """Create the lookup entries first named by this write, see ``DimensionField``."""
+        save_new_dimensions(
+            [validated_data.get(field) for field in DIMENSIONS] + [entry["grape"] for entry in blend or []]
+        )
+
     def validate_vintage(self, value):
-        current_year = date.today().year
-        if int(value) > current_year:
+        value = value.strip()
+        if not value or value.upper() in (NON_VINTAGE, "N.V."):
+            return value.upper().replace(".", "")
+
+        year = parse_vintage_year(value)
+        if year is None:
+            raise serializers.ValidationError('Vintage must be a year or "NV".')
+        if year > date.today().year:
             raise serializers.ValidationError("Vintage cannot be in the future.")
         return value
 
+    def validate_grapes(self, value):
+        if len(value) > MAX_BLEND_GRAPES:
+            raise serializers.ValidationError(f"A blend has at most {MAX_BLEND_GRAPES} grapes.")
+        if len({entry["grape"].key for entry in value}) < len(value):
+            raise serializers.ValidationError("Each grape can only appear once.")
+        if sum(entry.get("percentage") or 0 for entry in value) > 100:
+            raise serializers.ValidationError("Percentages cannot add up to more than 100.")
+        return value
+
+    def validate(self, attrs):
+        if "main_grape" in attrs and "blend" in attrs:
+            raise serializers.ValidationError("Send either grape or grapes, not both.")
+        return super().validate(attrs)
+
+    @transaction.atomic
+    def create(self, validated_data):
+        blend = self.pop_blend(validated_data)
+        self.save_new_dimensions(validated_data, blend)
+        wine = super().create(validated_data)
+        if blend is not None:
+            WineGrape.objects.set_blends([(wine, blend)])
+        return wine
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        blend = self.pop_blend(validated_data)
+        self.save_new_dimensions(validated_data, blend)
+        wine = super().update(instance, validated_data)
+        if blend is not None:
+            WineGrape.objects.set_blends([(wine, blend)])
+            # drop a prefetched blend so the response shows the new one
+            getattr(wine, "_prefetched_objects_cache", {}).pop("blend", None)
+        return wine
+
 
 class WineListSerializer(WineSerializer):
-    average_rating = serializers.FloatField(read_only=True, source="avg_rating")
+    # annotated by the views for the requesting user
+    is_saved = serializers.BooleanField(read_only=True)
 
     class Meta(WineSerializer.Meta):
-        fields = ("id", "title", "vintage", "price", "image", "average_rating")
+        fields = ("id", "title", "vintage", "price", "image", "average_rating", "saved_count", "is_saved")
 
 
 class WineDetailSerializer(WineSerializer):
-    average_rating = serializers.FloatField(read_only=True, source="avg_rating")
+    is_saved = serializers.BooleanField(read_only=True)
     reviews = WineReviewSerializer(many=True, read_only=True)
 
     class Meta(WineSerializer.Meta):
-        fields = WineSerializer.Meta.fields + ("average_rating", "reviews")
+        fields = WineSerializer.Meta.fields + ("average_rating", "saved_count", "is_saved", "reviews")
+
+
+class WineBulkSerializer(WineSerializer):
+    class Meta(WineSerializer.Meta):
+        # unique_wine_entry is checked once per batch, see wines/bulk.py
+        validators = []
+
+
+class WineChangeSerializer(WineSerializer):
+    class Meta(WineSerializer.Meta):
+        fields = WineSerializer.Meta.fields + ("updated_at",)
 
 
 class WineImageSerializer(serializers.ModelSerializer):
@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from wines import autocomplete
+from wines.cache import bump_catalog_version, bump_saved_versions
+from wines.models import Country, Grape, Region, Style, Wine, WineChange, WineReview, WineType
+
+SavedWine = Wine.saved_by_users.through
+
+
+def wines_saved(wines, created, previous=None):
+    """Record saved wines in the change feed, caches and autocomplete.
+
+    Called for every ``Wine.save``; bulk writes, which send no signals, call
+    it directly. ``previous`` are the ``autocomplete.indexed_values`` of
+    updated wines from before the write.
+    """
+    WineChange.objects.record(
+        [wine.pk for wine in wines], WineChange.CREATED if created else WineChange.UPDATED
+    )
+    bump_catalog_version()
+    if created:
+        previous = []
+    transaction.on_commit(lambda: autocomplete.wines_saved(wines, previous))
+
+
+@receiver(pre_save, sender=Wine)
+def wine_saving(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._autocomplete_values = autocomplete.indexed_values([instance])
+
+
+@receiver(post_save, sender=Wine)
+def wine_saved(sender, instance, created, **kwargs):
+    wines_saved([instance], created, instance.__dict__.pop("_autocomplete_values", None))
+
+
+@receiver(pre_delete, sender=Wine)
+def wine_deleting(sender, instance, **kwargs):
+    # read while the reviews and the blend still exist
+    instance._autocomplete_values = autocomplete.indexed_values([instance])
+
+
+@receiver(post_delete, sender=Wine)
+def wine_deleted(sender, instance, **kwargs):
+    WineChange.objects.record([instance.pk], WineChange.DELETED)
+    bump_catalog_version()
+    previous = instance.__dict__.pop("_autocomplete_values", None)
+    transaction.on_commit(lambda: autocomplete.wine_deleted(previous))
+
+
+@receiver(post_save, sender=WineType)
+@receiver(post_save, sender=Country)
+@receiver(post_save, sender=Region)
+@receiver(post_save, sender=Grape)
+@receiver(post_save, sender=Style)
+def dimension_saved(sender, instance, created, **kwargs):
+    if created:
+        return
+    # a rename shows on every wine using the value
+    WineChange.objects.record(instance.wines.values_list("id", flat=True), WineChange.UPDATED)
+    bump_catalog_version()
+    transaction.on_commit(autocomplete.invalidate)
+
+
+@receiver(post_save, sender=WineReview)
+def review_saved(sender, instance, **kwargs):
+    Wine.objects.refresh_ratings(Wine.objects.filter(pk=instance.wine_id))
+    # ratings and reviews are part of the cached list and detail responses
+    bump_catalog_version()
+
+# Deleted reviews have no post_delete receiver on purpose: one would stop queryset deletes and
+# the wine and user cascades from deleting reviews in a single DELETE. WineReview.delete and the
+# callers of bulk deletes refresh the ratings instead.
+
+
+def _saved_wine_ids(instance, reverse, pk_set):
+    """Ids of wines whose saved rows for ``instance`` exist, one per row."""
+    rows = SavedWine.objects.filter(**{"wine_id" if reverse else "user_id": instance.pk})
+    if pk_set is not None:
+        rows = rows.filter(**{"user_id__in" if reverse else "wine_id__in": pk_set})
+    # lock the rows so concurrent removals only count each of them once
+    return list(rows.select_for_update().values_list("wine_id", flat=True))
+
+
+def _change_saved_counts(wine_ids, delta):
+    if wine_ids:
+        Wine.objects.filter(pk__in=wine_ids).update(saved_count=F("saved_count") + delta)
+
+
+@receiver(m2m_changed, sender=SavedWine)
+def saved_wines_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep ``Wine.saved_count`` in sync with ``add``/``remove``/``clear``/``set``.
+
+    ``pk_set`` of ``post_add`` only holds the rows actually inserted; for
+    removals the rows still present are looked up before they are deleted.
+    """
+    if action in ("post_add", "pre_remove", "pre_clear"):
+        # the users whose is_saved flags change
+        if not reverse:
+            bump_saved_versions([instance.pk])
+        elif pk_set is not None:
+            bump_saved_versions(pk_set)
+        else:
+            bump_saved_versions(SavedWine.objects.filter(wine_id=instance.pk).values_list("user_id", flat=True))
+
+    if action == "post_add" and pk_set:
+        if reverse:
+            Wine.objects.filter(pk=instance.pk).update(saved_count=F("saved_count") + len(pk_set))
+        else:
+            _change_saved_counts(pk_set, 1)
+    elif action in ("pre_remove", "pre_clear"):
+        wine_ids = _saved_wine_ids(instance, reverse, pk_set)
+        if reverse:
+            if wine_ids:
+                Wine.objects.filter(pk=instance.pk).update(saved_count=F("saved_count") - len(wine_ids))
+        else:
+            _change_saved_counts(wine_ids, -1)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleting(sender, instance, **kwargs):
+    # the cascade removes the user's saved rows without m2m_changed
+    _change_saved_counts(_saved_wine_ids(instance, False, None), -1)
+    instance._reviewed_wine_ids = list(WineReview.objects.filter(user=instance).values_list("wine_id", flat=True))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    # the cascade deleted the user's reviews in one statement, refresh their wines the same way
+    wine_ids = instance.__dict__.pop("_reviewed_wine_ids", [])
+    if wine_ids:
+        Wine.objects.refresh_ratings(Wine.objects.filter(pk__in=wine_ids))
+        bump_catalog_version()
@@ -1,12 +1,32 @@
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from django.urls import reverse
-from wines.models import Wine, WineReview
+from wines.models import Country, Grape, Region, Wine, WineChange, WineReview, WineType, SlowQuery
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.core.management import call_command
+import json
 import tempfile
+import threading
+from io import StringIO
+from pathlib import Path
+from datetime import timedelta
+from unittest.mock import Mock, patch
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
 from PIL import Image
+from wine_library.db_router import ReplicaRouter, ReplicaRoutingMiddleware, is_pinned
+from wine_library.singleflight import across_workers, single_flight
+from wine_library.testing import QueryBudgetMixin
+from wines import autocomplete
+from wines.cache import CHANGED_KEY
 import logging
 
 logger = logging.getLogger("test_logger")
@@ -18,7 +38,7 @@ logger.addHandler(handler)
 
 User = get_user_model()
 
-class WineTests(APITestCase):
+class WineTests(QueryBudgetMixin, APITestCase):
     def setUp(self):
         self.admin = User.objects.create_superuser(email="admin@test.com", password="adminpass")
         self.user = User.objects.create_user(email="user@test.com", password="userpass")
@@ -29,8 +49,8 @@ class WineTests(APITestCase):
             title="Test Wine",
             vintage="2020",
             price=15.99,
-            wine_type="Red",
-            country="France",
+            wine_type=WineType.objects.resolve("Red"),
+            country=Country.objects.resolve("France"),
             capacity=0.75
         )
 
@@ -45,6 +65,309 @@ class WineTests(APITestCase):
         logger.info(f"Response body: {response.data}\n")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_count_estimated_above_threshold(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-list")
+        exact = self.client.get(url, {"country": "France"})
+        # drop the cached page so the count is computed again
+        cache.clear()
+        with self.settings(ESTIMATED_COUNT={"threshold": 0, "table_estimate_timeout": 0}):
+            estimated = self.client.get(url, {"country": "France"})
+        logger.info("TEST: test_list_count_estimated_above_threshold")
+        logger.info(f"Request: GET {url}?country=France")
+        logger.info(f"Response body: {exact.data}, {estimated.data}\n")
+        self.assertEqual(exact.data["count"], 1)
+        self.assertFalse(exact.data["count_is_estimated"])
+        self.assertTrue(estimated.data["count_is_estimated"])
+        self.assertIsNone(estimated.data["next"])
+        self.assertEqual(len(estimated.data["results"]), 1)
+
+    def test_pages_past_an_underestimated_count(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-list")
+        for index in range(2):
+            Wine.objects.create(title=f"Unestimated Wine {index}", capacity=0.75)
+        # the planner thinks the table holds a single wine
+        with self.settings(ESTIMATED_COUNT={"threshold": 0, "table_estimate_timeout": 0}), patch(
+            "wines.pagination.table_estimate", return_value=1
+        ):
+            pages = [self.client.get(url, {"page_size": 1, "page": page}) for page in (1, 2, 3, 4)]
+        logger.info("TEST: test_pages_past_an_underestimated_count")
+        logger.info(f"Request: GET {url}?page_size=1&page=1..4")
+        logger.info(f"Response status: {[page.status_code for page in pages]}\n")
+        self.assertEqual([page.status_code for page in pages], [200, 200, 200, 404])
+        self.assertEqual(pages[0].data["count"], 1)
+        self.assertTrue(pages[0].data["count_is_estimated"])
+        self.assertIsNotNone(pages[1].data["next"])
+        self.assertIsNone(pages[2].data["next"])
+        self.assertEqual(len({page.data["results"][0]["id"] for page in pages[:3]}), 3)
+
+    def test_list_served_from_cache_compressed(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-list")
+        for index in range(30):
+            Wine.objects.create(title=f"Cached Wine {index}", vintage="2019", capacity=0.75)
+        first = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        # only the user lookup of the JWT authentication
+        with self.assertQueryBudget(queries=1):
+            cached = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        plain = self.client.get(url)
+        Wine.objects.create(title="Fresh Wine", capacity=0.75)
+        fresh = self.client.get(url, {"page_size": 100})
+        logger.info("TEST: test_list_served_from_cache_compressed")
+        logger.info(f"Request: GET {url}")
+        logger.info(f"Response headers: {dict(cached.headers)}")
+        logger.info(f"Response status: {cached.status_code}\n")
+        self.assertEqual(first["Content-Encoding"], "gzip")
+        self.assertEqual(cached["Content-Encoding"], "gzip")
+        self.assertEqual(cached.content, first.content)
+        self.assertIn("Accept-Encoding", cached["Vary"])
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(json.loads(plain.content)["count"], 31)
+        self.assertIn("Fresh Wine", [wine["title"] for wine in fresh.data["results"]])
+
+    def test_change_feed_since_cursor(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-changes")
+        initial = self.client.get(url)
+        cursor = initial.data["cursor"]
+        updated = Wine.objects.create(title="Updated Wine", capacity=0.75)
+        updated.price = 30
+        updated.save()
+        deleted = Wine.objects.create(title="Deleted Wine", capacity=0.75)
+        deleted_id = deleted.id
+        deleted.delete()
+        # the test transaction is still open, so its changes are not final yet
+        pending = self.client.get(url, {"since": cursor})
+        # as if the writing transaction had committed long ago
+        WineChange.objects.update(txid=1)
+        response = self.client.get(url, {"since": "0-0", "limit": 10})
+        invalid = self.client.get(url, {"since": "yesterday"})
+        logger.info("TEST: test_change_feed_since_cursor")
+        logger.info(f"Request: GET {url}?since=0-0")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual([change["id"] for change in initial.data["results"]], [])
+        self.assertEqual(pending.data["results"], [])
+        self.assertEqual(
+            [(change["id"], change["change"]) for change in response.data["results"]],
+            [(self.wine.id, "created"), (updated.id, "updated"), (deleted_id, "deleted")],
+        )
+        self.assertEqual(response.data["results"][1]["wine"]["price"], 30)
+        self.assertIsNone(response.data["results"][2]["wine"])
+        self.assertFalse(response.data["has_more"])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_purge_wine_changes(self):
+        deleted = Wine.objects.create(title="Deleted Wine", capacity=0.75)
+        deleted.delete()
+        WineChange.objects.filter(action=WineChange.DELETED).update(
+            changed_at=timezone.now() - timedelta(days=60)
+        )
+        tombstone = WineChange.objects.get(action=WineChange.DELETED)
+        out = StringIO()
+        call_command("purge_wine_changes", stdout=out)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        response = self.client.get(reverse("wines:wine-changes"), {"since": "1-0"})
+        # a client that already synced past the purged tombstone missed nothing
+        after_tombstone = self.client.get(
+            reverse("wines:wine-changes"), {"since": f"{tombstone.txid}-{tombstone.id}"}
+        )
+        logger.info("TEST: test_purge_wine_changes")
+        logger.info(f"Output: {out.getvalue()}")
+        logger.info(f"Response status: {response.status_code}\n")
+        self.assertIn("Compacted 1 changes, purged 1 tombstones", out.getvalue())
+        self.assertEqual(
+            list(WineChange.objects.values_list("action", flat=True).order_by("id")),
+            [WineChange.CREATED, WineChange.PURGED],
+        )
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertEqual(after_tombstone.status_code, status.HTTP_200_OK)
+
+    def test_batch_fetch_preserves_order(self):
+        second = Wine.objects.create(title="Second Wine", capacity=0.75)
+        WineReview.objects.create(wine=second, user=self.user, rating=8)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-batch")
+        ids = f"{second.id},999999,{self.wine.id},{second.id}"
+        # user, wines with ratings, their blends and their reviews
+        with self.assertQueryBudget(queries=4):
+            response = self.client.get(url, {"ids": ids, "shape": "detail"})
+        too_many = self.client.get(url, {"ids": ",".join(map(str, range(1, 202)))})
+        logger.info("TEST: test_batch_fetch_preserves_order")
+        logger.info(f"Request: GET {url}?ids={ids}&shape=detail")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([wine["id"] for wine in response.data["results"]], [second.id, self.wine.id])
+        self.assertEqual(response.data["results"][0]["reviews"][0]["rating"], 8)
+        self.assertEqual(response.data["missing"], [999999])
+        self.assertEqual(too_many.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_autocomplete_grape(self):
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        cabernet = Grape.objects.resolve("Cabernet Sauvignon")
+        Wine.objects.create(title="Reserve", capacity=0.75).grapes.add(cabernet)
+        Wine.objects.create(title="Estate", capacity=0.75).grapes.add(cabernet)
+        Wine.objects.create(title="Andes", capacity=0.75).grapes.add(Grape.objects.resolve("Carménère"))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-autocomplete")
+        response = self.client.get(url, {"field": "grape", "prefix": "CA"})
+        with self.captureOnCommitCallbacks(execute=True):
+            Wine.objects.create(title="Etna", capacity=0.75).grapes.add(Grape.objects.resolve("Catarratto"))
+        added = self.client.get(url, {"field": "grape", "prefix": "carme"})
+        new = self.client.get(url, {"field": "grape", "prefix": "cat"})
+        renamed = Wine.objects.get(title="Reserve")
+        renamed.title = "Riserva"
+        with self.captureOnCommitCallbacks(execute=True):
+            renamed.save()
+        old_title = self.client.get(url, {"field": "title", "prefix": "rese"})
+        new_title = self.client.get(url, {"field": "title", "prefix": "ris"})
+        reviewed = Wine.objects.create(title="Rosato", capacity=0.75)
+        WineReview.objects.create(wine=reviewed, user=self.user, rating=8)
+        autocomplete.reset()
+        reviewed_title = self.client.get(url, {"field": "title", "prefix": "ros"})
+        with self.captureOnCommitCallbacks(execute=True):
+            reviewed.delete()
+        with patch("wines.autocomplete.current_version") as version:
+            deleted_title = self.client.get(url, {"field": "title", "prefix": "ros"})
+        invalid = self.client.get(url, {"field": "description", "prefix": "ca"})
+        logger.info("TEST: test_autocomplete_grape")
+        logger.info(f"Request: GET {url}?field=grape&prefix=CA")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data["results"],
+            [{"value": "Cabernet Sauvignon", "weight": 2}, {"value": "Carménère", "weight": 1}],
+        )
+        self.assertEqual(added.data["results"], [{"value": "Carménère", "weight": 1}])
+        self.assertEqual(new.data["results"], [{"value": "Catarratto", "weight": 1}])
+        self.assertEqual(old_title.data["results"], [])
+        self.assertEqual(new_title.data["results"], [{"value": "Riserva", "weight": 1}])
+        self.assertEqual(reviewed_title.data["results"], [{"value": "Rosato", "weight": 2}])
+        self.assertEqual(deleted_title.data["results"], [])
+        # the shared version was looked at moments ago
+        version.assert_not_called()
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_and_order_by_vintage(self):
+        Wine.objects.create(title="Old Wine", vintage="1995", capacity=0.75)
+        Wine.objects.create(title="Bubbles", vintage="NV", capacity=0.75)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-list")
+        in_range = self.client.get(url, {"min_vintage": 1990, "max_vintage": 2000})
+        ordered = self.client.get(url, {"ordering": "-vintage"})
+        logger.info("TEST: test_filter_and_order_by_vintage")
+        logger.info(f"Request: GET {url}?min_vintage=1990&max_vintage=2000")
+        logger.info(f"Response body: {in_range.data}\n")
+        self.assertEqual([wine["title"] for wine in in_range.data["results"]], ["Old Wine"])
+        self.assertEqual([wine["vintage"] for wine in ordered.data["results"]], ["2020", "1995", "NV"])
+
+    def test_ordering_and_multi_value_filters(self):
+        italian = Wine.objects.create(
+            title="Chianti", price=9.5, country=Country.objects.resolve("Italy"), capacity=0.75
+        )
+        Wine.objects.create(title="Rioja", price=30, country=Country.objects.resolve("Spain"), capacity=0.75)
+        WineReview.objects.create(wine=self.wine, user=self.user, rating=6)
+        review = WineReview.objects.create(wine=italian, user=self.user, rating=8)
+        WineReview.objects.create(wine=italian, user=self.admin, rating=9)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-list")
+        by_rating = self.client.get(url, {"ordering": "-rating"})
+        by_price = self.client.get(url, {"ordering": "price", "country": "France, italy"})
+        invalid = self.client.get(url, {"ordering": "description"})
+        logger.info("TEST: test_ordering_and_multi_value_filters")
+        logger.info(f"Request: GET {url}?ordering=-rating")
+        logger.info(f"Response body: {by_rating.data}\n")
+        self.assertEqual(
+            [(wine["title"], wine["average_rating"]) for wine in by_rating.data["results"]],
+            [("Chianti", 8.5), ("Test Wine", 6.0), ("Rioja", None)],
+        )
+        self.assertEqual([wine["title"] for wine in by_price.data["results"]], ["Chianti", "Test Wine"])
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+        review.delete()
+        self.client.put(reverse("wines:wine-review", args=[self.wine.id]), {"rating": 10}, format="json")
+        italian.refresh_from_db()
+        self.wine.refresh_from_db()
+        self.assertEqual((italian.average_rating, self.wine.average_rating), (9.0, 10.0))
+        # the cascade deletes the admin's review in bulk
+        self.admin.delete()
+        italian.refresh_from_db()
+        self.assertIsNone(italian.average_rating)
+
+    def test_dimension_names_canonicalized(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+        url = reverse("wines:wine-list")
+        data = {
+            "title": "Variant Wine", "vintage": "2021", "country": "  FRANCE ", "grape": "Albariño", "capacity": 0.75
+        }
+        response = self.client.post(url, data)
+        self.client.post(url, {"title": "Plain Wine", "vintage": "2021", "grape": "albarino", "capacity": 0.75})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        # user, lookup id, count estimate, exact count below the threshold, page, saved flags
+        with self.assertQueryBudget(queries=6):
+            filtered = self.client.get(url, {"country": "france"})
+        by_grape = self.client.get(url, {"grape": "ALBA"})
+        logger.info("TEST: test_dimension_names_canonicalized")
+        logger.info(f"Request: POST {url}")
+        logger.info(f"Request body: {data}")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["country"], "France")
+        self.assertEqual(response.data["region"], "")
+        self.assertEqual(Country.objects.count(), 1)
+        self.assertEqual(Grape.objects.get().name, "Albariño")
+        self.assertEqual(
+            [wine["title"] for wine in filtered.data["results"]], ["Test Wine", "Variant Wine"]
+        )
+        self.assertEqual(by_grape.data["count"], 2)
+
+    def test_grape_blends_any_and_all(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+        url = reverse("wines:wine-list")
+        data = {
+            "title": "Bordeaux Blend",
+            "vintage": "2019",
+            "grapes": [{"grape": "Cabernet Franc", "percentage": 40}, {"grape": "Merlot", "percentage": 60}],
+        }
+        response = self.client.post(url, data, format="json")
+        self.client.post(url, {"title": "Pure Merlot", "vintage": "2019", "grape": "merlot"}, format="json")
+        too_much = self.client.post(
+            url,
+            {"title": "Too Much", "vintage": "2019", "grapes": [{"grape": "Syrah", "percentage": 101}]},
+            format="json",
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        any_grape = self.client.get(url, {"grape": "merlot,cabernet"})
+        all_grapes = self.client.get(url, {"grape": "merlot,cabernet", "grape_match": "all"})
+        unknown = self.client.get(url, {"grape": "merlot,nebbiolo", "grape_match": "all"})
+        invalid = self.client.get(url, {"grape": "merlot", "grape_match": "most"})
+        logger.info("TEST: test_grape_blends_any_and_all")
+        logger.info(f"Request: POST {url}")
+        logger.info(f"Request body: {data}")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["grape"], "Merlot")
+        self.assertEqual(
+            response.data["grapes"],
+            [{"grape": "Merlot", "percentage": 60}, {"grape": "Cabernet Franc", "percentage": 40}],
+        )
+        self.assertEqual(too_much.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(any_grape.data["count"], 2)
+        self.assertEqual([wine["title"] for wine in all_grapes.data["results"]], ["Bordeaux Blend"])
+        self.assertEqual(unknown.data["count"], 0)
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+        detail_url = reverse("wines:wine-detail", args=[response.data["id"]])
+        patched = self.client.patch(detail_url, {"grape": "Malbec"}, format="json")
+        self.assertEqual(patched.data["grapes"], [{"grape": "Malbec", "percentage": None}])
+
     def test_get_wine_by_id(self):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
         url = reverse("wines:wine-detail", args=[self.wine.id])
@@ -55,6 +378,23 @@ class WineTests(APITestCase):
         logger.info(f"Response body: {response.data}\n")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_list_and_detail_query_budget(self):
+        for index in range(5):
+            reviewer = User.objects.create_user(email=f"reviewer{index}@test.com", password="pass")
+            WineReview.objects.create(wine=self.wine, user=reviewer, rating=index)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        with self.assertQueryBudget("wines:wine-list"):
+            list_response = self.client.get(reverse("wines:wine-list"))
+        url = reverse("wines:wine-detail", args=[self.wine.id])
+        with self.assertQueryBudget("wines:wine-detail"):
+            response = self.client.get(url)
+        logger.info("TEST: test_list_and_detail_query_budget")
+        logger.info(f"Request: GET {url}")
+        logger.info(f"Server-Timing: {response['Server-Timing']}\n")
+        self.assertEqual(list_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["reviews"]), 5)
+        self.assertIn("db;dur=", response["Server-Timing"])
+
     def test_get_wine_non_existing(self):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
         url = reverse("wines:wine-detail", args=[99999])
@@ -86,6 +426,44 @@ class WineTests(APITestCase):
         logger.info(f"Response body: {response.data}\n")
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
+    def test_bulk_create_and_update_wines(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+        url = reverse("wines:wine-bulk")
+        data = [
+            {"title": "Bulk Red", "vintage": "2018", "capacity": 0.75, "price": 10},
+            {"title": "Test Wine", "vintage": "2020", "capacity": 0.75},
+        ]
+        rejected = self.client.post(url, data, format="json")
+        new_region = [{**data[0], "title": "Mosel Wine", "region": "Mosel"}, data[1]]
+        rejected_new_region = self.client.post(url, new_region, format="json")
+        # user, batch uniqueness check, insert and change feed entry inside a savepoint
+        with self.assertQueryBudget(queries=6):
+            response = self.client.post(f"{url}?partial_success=true", data, format="json")
+        logger.info("TEST: test_bulk_create_and_update_wines")
+        logger.info(f"Request: POST {url}?partial_success=true")
+        logger.info(f"Request body: {data}")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual(rejected.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([item["status"] for item in rejected.data["results"]], ["skipped", "error"])
+        self.assertEqual(rejected_new_region.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Region.objects.filter(key="mosel").exists())
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        created_id = response.data["results"][0]["id"]
+        self.assertEqual(Wine.objects.get(id=created_id).vintage_year, 2018)
+        self.assertTrue(WineChange.objects.filter(wine_id=created_id, action=WineChange.CREATED).exists())
+
+        updates = [{"id": created_id, "price": 12}, {"id": self.wine.id, "price": 17}]
+        response = self.client.patch(url, updates, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(float(Wine.objects.get(id=self.wine.id).price), 17)
+        self.assertEqual(
+            WineChange.objects.filter(wine_id__in=[created_id, self.wine.id], action=WineChange.UPDATED).count(), 2
+        )
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        self.assertEqual(self.client.patch(url, updates, format="json").status_code, status.HTTP_403_FORBIDDEN)
+
     def test_create_wine_user(self):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
         url = reverse("wines:wine-list")
@@ -119,6 +497,51 @@ class WineTests(APITestCase):
         logger.info(f"Response status: {response.status_code}")
         logger.info(f"Response body: {response.data}\n")
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # the rejected wine does not leave its new country behind
+        self.assertFalse(Country.objects.filter(key="spain").exists())
+
+    def test_non_ascii_digits_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+        url = reverse("wines:wine-list")
+        data = {"title": "Superscript Wine", "vintage": "²", "capacity": 0.75}
+        response = self.client.post(url, data)
+        changes = self.client.get(reverse("wines:wine-changes"), {"since": "²-0", "limit": "²"})
+        logger.info("TEST: test_non_ascii_digits_rejected")
+        logger.info(f"Request: POST {url}")
+        logger.info(f"Request body: {data}")
+        logger.info(f"Response status: {response.status_code}, {changes.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("vintage", response.data)
+        self.assertEqual(changes.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_vintage_filters_rejected(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-list")
+        responses = [
+            self.client.get(url, {"min_vintage": "abc"}),
+            self.client.get(url, {"max_vintage": "²"}),
+        ]
+        logger.info("TEST: test_invalid_vintage_filters_rejected")
+        logger.info(f"Request: GET {url}?min_vintage=abc, ?max_vintage=²")
+        logger.info(f"Response status: {[response.status_code for response in responses]}\n")
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_400_BAD_REQUEST] * 2)
+        self.assertIn("min_vintage", responses[0].data)
+        self.assertIn("max_vintage", responses[1].data)
+
+    def test_create_non_vintage_wine(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+        url = reverse("wines:wine-list")
+        data = {"title": "Brut", "vintage": "nv", "wine_type": "Sparkling", "capacity": 0.75}
+        response = self.client.post(url, data)
+        logger.info("TEST: test_create_non_vintage_wine")
+        logger.info(f"Request: POST {url}")
+        logger.info(f"Request body: {data}")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["vintage"], "NV")
+        self.assertIsNone(Wine.objects.get(title="Brut").vintage_year)
 
 # update wine
 
@@ -289,8 +712,8 @@ class WineTests(APITestCase):
             title="Test Wine 2",
             vintage="2020",
             price=15.99,
-            wine_type="Red",
-            country="France",
+            wine_type=WineType.objects.resolve("Red"),
+            country=Country.objects.resolve("France"),
             capacity=0.75
         )
         token = str(RefreshToken.for_user(user).access_token)
@@ -311,6 +734,22 @@ class WineTests(APITestCase):
         self.assertEqual(response2.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(WineReview.objects.filter(wine=wine, user=user).count(), 1)
 
+    def test_put_review_creates_then_updates(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        url = reverse("wines:wine-review", args=[self.wine.id])
+        created = self.client.put(url, {"rating": 6, "comment": "Good"}, format="json")
+        updated = self.client.put(url, {"rating": 9, "comment": "Even better"}, format="json")
+        logger.info("TEST: test_put_review_creates_then_updates")
+        logger.info(f"Request: PUT {url}")
+        logger.info(f"Response status: {created.status_code}, {updated.status_code}")
+        logger.info(f"Response body: {updated.data}\n")
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(updated.status_code, status.HTTP_200_OK)
+        self.assertEqual(updated.data["id"], created.data["id"])
+        self.assertEqual(updated.data["created_at"], created.data["created_at"])
+        review = WineReview.objects.get(wine=self.wine, user=self.user)
+        self.assertEqual((review.rating, review.comment), (9, "Even better"))
+
 # favorites
 
     def test_save_unsave_favorites(self):
@@ -332,6 +771,199 @@ class WineTests(APITestCase):
         logger.info(f"Response body: {unsave_response.data}\n")
         self.assertEqual(unsave_response.status_code, status.HTTP_200_OK)
 
+    def test_saved_count_maintained(self):
+        other = Wine.objects.create(title="Other Wine", capacity=0.75)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        self.client.post(reverse("wines:wine-save", args=[self.wine.id]))
+        self.client.post(reverse("wines:wine-save", args=[self.wine.id]))
+        self.admin.saved_wines.add(self.wine, other)
+        self.admin.saved_wines.remove(other, other)
+        response = self.client.get(reverse("wines:wine-list"), {"ordering": "-saved_count", "min_saved": 1})
+        logger.info("TEST: test_saved_count_maintained")
+        logger.info("Request: GET /wines/?ordering=-saved_count&min_saved=1")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Response body: {response.data}\n")
+        self.assertEqual([wine["saved_count"] for wine in response.data["results"]], [2])
+        invalid = self.client.get(reverse("wines:wine-list"), {"min_saved": "1.5"})
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("min_saved", invalid.data)
+
+        self.wine.saved_by_users.clear()
+        other.saved_by_users.add(self.user)
+        self.client.post(reverse("wines:wine-unsave", args=[self.wine.id]))
+        self.wine.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.wine.saved_count, other.saved_count), (0, 1))
+
+        self.user.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.saved_count, 0)
+
+    def test_is_saved_flag_per_user(self):
+        other = Wine.objects.create(title="Other Wine", capacity=0.75)
+        self.user.saved_wines.add(self.wine)
+        url = reverse("wines:wine-list")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+        admin_list = self.client.get(url)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        # user, count, page, saved flags
+        with self.assertQueryBudget(queries=4):
+            user_list = self.client.get(url)
+        detail = self.client.get(reverse("wines:wine-detail", args=[other.id]))
+        self.client.post(reverse("wines:wine-unsave", args=[self.wine.id]))
+        after_unsave = self.client.get(url)
+        logger.info("TEST: test_is_saved_flag_per_user")
+        logger.info(f"Request: GET {url}")
+        logger.info(f"Response body: {user_list.data}\n")
+
+        def flags(response):
+            return {wine["title"]: wine["is_saved"] for wine in json.loads(response.content)["results"]}
+
+        self.assertEqual(flags(user_list), {"Test Wine": True, "Other Wine": False})
+        self.assertEqual(flags(admin_list), {"Test Wine": False, "Other Wine": False})
+        self.assertFalse(detail.data["is_saved"])
+        self.assertEqual(flags(after_unsave), {"Test Wine": False, "Other Wine": False})
+
+    def test_saving_flips_is_saved_in_cached_list(self):
+        url = reverse("wines:wine-list")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        before = self.client.get(url)
+        # user only, the page comes from the response cache
+        with self.assertQueryBudget(queries=1):
+            cached = self.client.get(url)
+        self.client.post(reverse("wines:wine-save", args=[self.wine.id]))
+        after_save = self.client.get(url)
+        logger.info("TEST: test_saving_flips_is_saved_in_cached_list")
+        logger.info(f"Request: GET {url}")
+        logger.info(f"Response body: {after_save.data}\n")
+        self.assertEqual(json.loads(before.content), json.loads(cached.content))
+        self.assertFalse(json.loads(cached.content)["results"][0]["is_saved"])
+        self.assertTrue(json.loads(after_save.content)["results"][0]["is_saved"])
+
+    def test_pages_shared_across_users(self):
+        self.user.saved_wines.add(self.wine)
+        keys = []
+
+        def record(key, compute):
+            keys.append(key)
+            return compute()
+
+        url = reverse("wines:wine-list")
+        flags = {}
+        with patch("wines.pagination.single_flight", side_effect=record):
+            for name, token in (("user", self.user_token), ("admin", self.admin_token)):
+                self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+                response = self.client.get(url, {"page_size": 5})
+                flags[name] = [wine["is_saved"] for wine in response.data["results"]]
+        logger.info("TEST: test_pages_shared_across_users")
+        logger.info(f"Keys: {keys}\n")
+        # the count and the page of each request, the same SQL for both users
+        self.assertEqual(len(keys), 4)
+        self.assertEqual(keys[:2], keys[2:])
+        self.assertEqual(flags, {"user": [True], "admin": [False]})
+
+    def test_reconcile_saved_counts(self):
+        self.user.saved_wines.add(self.wine)
+        Wine.objects.filter(pk=self.wine.pk).update(saved_count=5)
+        out = StringIO()
+        call_command("reconcile_saved_counts", stdout=out)
+        self.wine.refresh_from_db()
+        logger.info("TEST: test_reconcile_saved_counts")
+        logger.info(f"Output: {out.getvalue()}")
+        self.assertEqual(self.wine.saved_count, 1)
+        self.assertIn("Fixed saved_count of 1 wines", out.getvalue())
+
+    def test_save_pins_user_to_primary(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        save_url = reverse("wines:wine-save", args=[self.wine.id])
+        with self.settings(DATABASE_REPLICAS=["replica_1"]), patch(
+            "wine_library.db_router.healthy_replicas", return_value=[]
+        ):
+            self.client.get(reverse("wines:wine-list"))
+            pinned_after_read = is_pinned(self.user.id)
+            response = self.client.post(save_url)
+        logger.info("TEST: test_save_pins_user_to_primary")
+        logger.info(f"Request: POST {save_url}")
+        logger.info(f"Response status: {response.status_code}\n")
+        self.assertFalse(pinned_after_read)
+        self.assertTrue(is_pinned(self.user.id))
+
+    def test_one_replica_per_request(self):
+        router = ReplicaRouter()
+
+        def get_response(request):
+            return HttpResponse(",".join(router.db_for_read(Wine) for _ in range(20)))
+
+        request = RequestFactory().get(reverse("wines:wine-list"))
+        request.user = AnonymousUser()
+        with self.settings(DATABASE_REPLICAS=["replica_1", "replica_2"]), patch(
+            "wine_library.db_router.healthy_replicas", return_value=["replica_1", "replica_2"]
+        ):
+            aliases = set(ReplicaRoutingMiddleware(get_response)(request).content.decode().split(","))
+        logger.info("TEST: test_one_replica_per_request")
+        logger.info(f"Aliases: {aliases}\n")
+        self.assertEqual(len(aliases), 1)
+        self.assertIn(aliases.pop(), ["replica_1", "replica_2"])
+        self.assertEqual(router.db_for_read(Wine), "default")
+
+    def test_replica_reads_not_cached_right_after_a_change(self):
+        url = reverse("wines:wine-list")
+        with self.settings(DATABASE_REPLICAS=["replica_1"]), patch(
+            "wine_library.db_router.healthy_replicas", return_value=[]
+        ), patch("wines.cache.current_replica", return_value="replica_1"):
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+            self.client.patch(reverse("wines:wine-detail", args=[self.wine.id]), {"price": 30}, format="json")
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as lagging:
+                self.client.get(url)
+            lagging_queries = len(lagging)
+            cache.delete(CHANGED_KEY)
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as caught_up:
+                self.client.get(url)
+        logger.info("TEST: test_replica_reads_not_cached_right_after_a_change")
+        logger.info(f"Queries: {lagging_queries} right after the change, {len(caught_up)} once replicas caught up\n")
+        self.assertGreater(lagging_queries, 1)
+        # user only, served from the response cache
+        self.assertEqual(len(caught_up), 1)
+
+    def test_admin_review_changelist_and_bulk_delete(self):
+        url = reverse("admin:wines_winereview_changelist")
+        self.client.force_login(self.admin)
+        WineReview.objects.create(wine=self.wine, user=self.user, rating=7)
+        # warm up the cached table estimate of the paginator
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as one_review:
+            self.client.get(url)
+        one_review_queries = len(one_review)
+        for index in range(5):
+            reviewer = User.objects.create_user(email=f"reviewer{index}@test.com", password="pass")
+            WineReview.objects.create(wine=self.wine, user=reviewer, rating=index, comment="ok")
+        with CaptureQueriesContext(connection) as many_reviews:
+            response = self.client.get(url)
+        many_reviews_queries = len(many_reviews)
+        selected = list(WineReview.objects.filter(rating__lt=3).values_list("id", flat=True))
+        with CaptureQueriesContext(connection) as delete_queries:
+            delete = self.client.post(url, {"action": "delete_reviews", "_selected_action": selected})
+        review_deletes = [
+            query["sql"] for query in delete_queries
+            if query["sql"].startswith(f'DELETE FROM "{WineReview._meta.db_table}"')
+        ]
+        logger.info("TEST: test_admin_review_changelist_and_bulk_delete")
+        logger.info(f"Request: GET {url}")
+        logger.info(f"Response status: {response.status_code}")
+        logger.info(f"Queries: {one_review_queries} for 1 review, {many_reviews_queries} for 6 reviews\n")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(one_review_queries, 0)
+        self.assertEqual(one_review_queries, many_reviews_queries)
+        self.assertEqual(delete.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(WineReview.objects.count(), 3)
+        self.assertEqual(len(review_deletes), 1)
+        self.assertEqual(str(WineReview.objects.get(user=self.user)), "user@test.com – Test Wine: 7")
+        self.wine.refresh_from_db()
+        self.assertAlmostEqual(self.wine.average_rating, (7 + 3 + 4) / 3)
+
 #image
 
     def test_upload_wine_image(self):
@@ -377,4 +1009,198 @@ class WineTests(APITestCase):
         logger.info("Response body: [HTML content hidden]\n")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_seed_catalog(self):
+        call_command(
+            "seed_catalog", "--wines", "50", "--reviews", "200", "--users", "20",
+            "--batch-size", "15", stdout=StringIO(),
+        )
+        logger.info("TEST: test_seed_catalog")
+        logger.info(f"Wines: {Wine.objects.count()}, reviews: {WineReview.objects.count()}\n")
+        self.assertEqual(Wine.objects.count(), 51)
+        self.assertEqual(User.objects.count(), 22)
+        self.assertGreater(WineReview.objects.count(), 100)
+
+    def test_benchmark_against_own_baseline(self):
+        with tempfile.NamedTemporaryFile(suffix=".json") as baseline:
+            call_command(
+                "benchmark_api", "--seed", "--wines", "20", "--reviews", "40", "--users", "5",
+                "--iterations", "2", "--warmup", "0", "--output", baseline.name, stdout=StringIO(),
+            )
+            call_command(
+                "benchmark_api", "--iterations", "2", "--warmup", "0",
+                "--compare", baseline.name, "--threshold", "100", stdout=StringIO(),
+            )
+            with open(baseline.name, encoding="utf-8") as output:
+                results = json.load(output)
+        logger.info("TEST: test_benchmark_against_own_baseline")
+        logger.info(f"Results: {results}\n")
+        self.assertIn("wines:list", results)
+        self.assertIn("user:manage", results)
+
+    def test_metrics_endpoint(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        self.client.get(reverse("wines:wine-list"))
+        with tempfile.TemporaryDirectory() as metrics_dir, self.settings(METRICS_DIR=metrics_dir):
+            # left behind by a worker that exited
+            exited = Path(metrics_dir) / "metrics-999999999.json"
+            exited.write_text(json.dumps({"counters": [], "gauges": [["requests_in_flight", [], 7]], "histograms": []}))
+            anonymous = APIClient().get("/metrics")
+            with self.settings(METRICS_TOKEN="scrape"):
+                forged = self.client.get("/metrics")
+                response = APIClient().get("/metrics", HTTP_AUTHORIZATION="Bearer scrape")
+            exited_removed = not exited.exists()
+        body = response.content.decode()
+        logger.info("TEST: test_metrics_endpoint")
+        logger.info("Request: GET /metrics")
+        logger.info(f"Response status: {response.status_code}\n")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((anonymous.status_code, forged.status_code), (403, 403))
+        self.assertIn('http_requests_total{status="200",view="WineViewSet.list"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="WineViewSet.list",le="+Inf"}', body)
+        self.assertTrue(exited_removed)
+        self.assertNotIn("requests_in_flight 7", body)
+
+    def test_admission_control_sheds_load(self):
+        def limited(views, max_concurrent=32, reserved=8):
+            config = {"max_concurrent": max_concurrent, "reserved": reserved, "retry_after": 3, "views": views}
+            return self.settings(ADMISSION_CONTROL=config)
+
+        url = reverse("wines:wine-list")
+        with limited({"WineViewSet.list": {"concurrency": 0, "queue": 0, "timeout": 0}}):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+            queue_full = client.get(url)
+        with limited({"WineViewSet.list": {"concurrency": 0, "queue": 1, "timeout": 0.01}}):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+            timed_out = client.get(url)
+        # one slot, reserved for priority requests
+        own_limits = {"concurrency": 8, "queue": 0, "timeout": 0}
+        with limited({"WineViewSet.list": own_limits, "WineViewSet.create": own_limits}, 1, 1):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+            overloaded = client.get(url)
+            write = client.post(url, {"title": "Priority Wine", "vintage": "2020", "capacity": 0.75})
+            cheap = client.get(reverse("wines:wine-detail", args=[self.wine.id]))
+            forged = APIClient()
+            forged.credentials(HTTP_AUTHORIZATION="Bearer x")
+            forged_write = forged.post(url, {"title": "Forged Wine", "vintage": "2020", "capacity": 0.75})
+        throttle = Mock(allow_request=Mock(return_value=False), wait=Mock(return_value=1))
+        with patch("wines.views.WineViewSet.get_throttles", return_value=[throttle]):
+            throttled = client.get(reverse("wines:wine-detail", args=[self.wine.id]))
+        with tempfile.TemporaryDirectory() as metrics_dir, self.settings(METRICS_DIR=metrics_dir):
+            self.client.force_login(self.admin)
+            body = self.client.get("/metrics").content.decode()
+        logger.info("TEST: test_admission_control_sheds_load")
+        logger.info(f"Request: GET {url}")
+        logger.info(f"Response status: {queue_full.status_code}, {timed_out.status_code}, {overloaded.status_code}\n")
+        self.assertEqual((queue_full.status_code, queue_full["Retry-After"]), (429, "3"))
+        self.assertEqual(timed_out.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(overloaded.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(write.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(forged_write.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(cheap.status_code, status.HTTP_200_OK)
+        self.assertIn('admission_rejections_total{reason="queue_full",view="WineViewSet.list"}', body)
+        self.assertNotIn('throttle_rejections_total{view="WineViewSet.list"}', body)
+        self.assertEqual(throttled.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('throttle_rejections_total{view="WineViewSet.retrieve"} 1', body)
+        self.assertIn('admission_limit{limit="concurrency",view="WineViewSet.list"}', body)
+
+    def test_single_flight_coalesces_identical_work(self):
+        started, release, calls = threading.Event(), threading.Event(), []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ["page"]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight("hot", compute))) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        # a stuck leader is waited for no longer than wait_timeout
+        started.clear()
+        release.clear()
+        stuck = threading.Thread(target=lambda: single_flight("stuck", compute))
+        stuck.start()
+        started.wait(5)
+        with self.settings(SINGLE_FLIGHT={**settings.SINGLE_FLIGHT, "wait_timeout": 0.05}):
+            fallback = single_flight("stuck", lambda: ["computed"])
+        release.set()
+        stuck.join()
+
+        # workers share through the cache: a leader publishes its result, a vanished leader is not waited for
+        started.clear()
+        release.clear()
+        leader = threading.Thread(target=lambda: across_workers("across", compute))
+        leader.start()
+        started.wait(5)
+        threading.Timer(0.05, release.set).start()
+        shared = across_workers("across", lambda: ["computed"])
+        leader.join()
+        cache.set("single-flight:lock:crashed", "gone")
+        threading.Timer(0.05, cache.delete, ["single-flight:lock:crashed"]).start()
+        crashed = across_workers("crashed", lambda: ["computed"])
+        logger.info("TEST: test_single_flight_coalesces_identical_work")
+        logger.info(f"Results: {results}, {fallback}, {shared}, {crashed}\n")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(results, [["page"]] * 5)
+        self.assertEqual(fallback, ["computed"])
+        self.assertEqual(shared, ["page"])
+        self.assertEqual(crashed, ["computed"])
+
+    def test_slow_query_recorder(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+        recorder = {"enabled": True, "threshold_ms": 0, "sample_rate": 1, "interval": 300}
+        with self.settings(SLOW_QUERY_RECORDER=recorder):
+            self.client.get(reverse("wines:wine-list"), {"country": "France", "min_price": 10})
+        slow_query = SlowQuery.objects.get()
+        self.client.force_login(self.admin)
+        admin_response = self.client.get("/admin/wines/slowquery/")
+        logger.info("TEST: test_slow_query_recorder")
+        logger.info(f"Slow query: {slow_query.filter_signature}")
+        logger.info(f"Plan: {slow_query.plan}\n")
+        self.assertEqual(slow_query.filter_signature, "WineViewSet.list?country,min_price")
+        self.assertIn("Execution Time", slow_query.plan)
+        self.assertContains(admin_response, "WineViewSet.list?country,min_price")
+
+    def test_staff_request_profiling(self):
+        with tempfile.TemporaryDirectory() as profiles, self.settings(
+            PROFILING={**settings.PROFILING, "dir": profiles}
+        ):
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.user_token}")
+            user_response = self.client.get(reverse("wines:wine-list"), HTTP_X_PROFILE="1")
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+            response = self.client.get(reverse("wines:wine-list"), HTTP_X_PROFILE="1")
+            profile_id = response["X-Profile-Id"]
+            report = self.client.get(
+                reverse("profile-download", args=[profile_id]), {"as": "txt"}
+            )
+        logger.info("TEST: test_staff_request_profiling")
+        logger.info(f"Profile id: {profile_id}")
+        logger.info(f"Report status: {report.status_code}\n")
+        self.assertNotIn("X-Profile-Id", user_response)
+        self.assertEqual(report.status_code, status.HTTP_200_OK)
+        self.assertIn(b"function calls", report.content)
+
+    def test_schema_served_with_etag(self):
+        url = "/api/schema/"
+        with tempfile.TemporaryDirectory() as schema_dir, self.settings(OPENAPI_SCHEMA_DIR=schema_dir):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        logger.info("TEST: test_schema_served_with_etag")
+        logger.info(f"Request: GET {url}")
+        logger.info(f"Response status: {response.status_code}, {cached.status_code}")
+        logger.info(f"Response headers: {dict(response.headers)}\n")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
     
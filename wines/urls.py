@@ -2,12 +2,16 @@ from django.urls import path, include
 from rest_framework import routers
 
 from wines.views import (
+    WineChangeFeedView,
     WineViewSet,
 )
 
 router = routers.DefaultRouter()
 router.register("wines", WineViewSet)
 
-urlpatterns = [path("", include(router.urls))]
+urlpatterns = [
+    path("changes/", WineChangeFeedView.as_view(), name="wine-changes"),
+    path("", include(router.urls)),
+]
 
 app_name = "wines"
@@ -1,31 +1,99 @@
-from django.db.models import Avg
+import copy
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch
 from rest_framework.response import Response
 from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
 from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
-from wines.models import Wine, WineReview
+from wine_library import metrics
+from wine_library.singleflight import single_flight
+from wines import autocomplete
+from wines.bulk import bulk_create_wines, bulk_update_wines
+from wines.cache import CachedResponseMixin, bump_catalog_version, bump_saved_versions, request_digest
+from wines.models import DIMENSIONS, Grape, Wine, WineChange, WineGrape, WineReview, is_ascii_digits
+from wines.pagination import EstimatedCountPagination
 from wines.permissions import IsAdminOrIfAuthenticatedReadOnly
-from wines.serializers import WineSerializer, WineListSerializer, WineDetailSerializer, WineImageSerializer, WineReviewSerializer
+from wines.serializers import WineSerializer, WineListSerializer, WineDetailSerializer, WineImageSerializer, WineReviewSerializer, WineChangeSerializer
+
+
+def prefetch_blend():
+    return Prefetch("blend", queryset=WineGrape.objects.select_related("grape"))
+
+
+def saved_by(user, wine="pk"):
+    """Whether the user saved the wine referenced by ``wine``, a semi-join on the (user, wine) unique index."""
+    return Exists(Wine.saved_by_users.through.objects.filter(user_id=user.pk, wine_id=OuterRef(wine)))
+
 
+def with_saved_flags(wines, user):
+    """Copies of the wines with the user's ``is_saved``, looked up in one query.
+
+    The wines may be shared with concurrent requests of other users, so they
+    are copied rather than flagged in place.
+    """
+    saved = set()
+    if user.is_authenticated and wines:
+        saved = set(
+            Wine.saved_by_users.through.objects.filter(
+                user_id=user.pk, wine_id__in=[wine.pk for wine in wines]
+            ).values_list("wine_id", flat=True)
+        )
+    flagged = []
+    for wine in wines:
+        wine = copy.copy(wine)
+        wine.is_saved = wine.pk in saved
+        flagged.append(wine)
+    return flagged
 
 class WineViewSet(
-    viewsets.ModelViewSet
+    CachedResponseMixin,
+    viewsets.ModelViewSet,
 ):
     queryset = Wine.objects.all()
     serializer_class = WineSerializer
     permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+    pagination_class = EstimatedCountPagination
+    batch_max_ids = 200
+    bulk_max_items = 1000
+    max_grape_filters = 10
+    # ?ordering values and their fields, each backed by an index (see Wine.Meta.indexes)
+    ordering_fields = {
+        "price": "price",
+        "abv": "abv",
+        "vintage": "vintage_year",
+        "rating": "average_rating",
+        "saved_count": "saved_count",
+        "updated_at": "updated_at",
+    }
+    # actions that only need the wine row, not ratings or filters
+    row_only_actions = ("add_review", "review", "delete_review", "save", "unsave", "upload_image")
 
     def get_queryset(self):
         """Retrieve the wines with filters"""
-        queryset = self.queryset.annotate(avg_rating=Avg("reviews__rating"))
+        if self.action in self.row_only_actions:
+            return self.queryset
+
+        # list and retrieve load the same rows for every user and flag is_saved afterwards
+        queryset = self.queryset
+
+        if self.action != "list":
+            queryset = queryset.select_related(*DIMENSIONS).prefetch_related(prefetch_blend())
+
+        if self.action == "retrieve":
+            queryset = queryset.prefetch_related(
+                Prefetch("reviews", queryset=WineReview.objects.select_related("user"))
+            )
 
         title = self.request.query_params.get("title")
-        wine_type = self.request.query_params.get("wine_type")
         grape = self.request.query_params.get("grape")
-        country = self.request.query_params.get("country")
+        grape_match = self.request.query_params.get("grape_match", "any")
 
         min_price = self.request.query_params.get("min_price")
         max_price = self.request.query_params.get("max_price")
@@ -39,18 +107,27 @@ class WineViewSet(
         min_rating = self.request.query_params.get("min_rating")
         max_rating = self.request.query_params.get("max_rating")
 
+        min_vintage = self.request.query_params.get("min_vintage")
+        max_vintage = self.request.query_params.get("max_vintage")
+
+        min_saved = self.request.query_params.get("min_saved")
+
+        ordering = self.request.query_params.get("ordering")
+
         # Apply filters
         if title:
             queryset = queryset.filter(title__icontains=title)
 
-        if wine_type:
-            queryset = queryset.filter(wine_type__iexact=wine_type)
+        # names are resolved in the small lookup tables, wines are filtered by indexed FK ids
+        for field, model in DIMENSIONS.items():
+            value = self.request.query_params.get(field)
+            if value:
+                names = [name for name in value.split(",") if name.strip()]
+                ids = [pk for ids in model.objects.ids_matching_each(names) for pk in ids]
+                queryset = queryset.filter(**{f"{field}_id__in": ids})
 
         if grape:
-            queryset = queryset.filter(grape__icontains=grape)
-
-        if country:
-            queryset = queryset.filter(country__iexact=country)
+            queryset = queryset.filter(*self.grape_filters(grape, grape_match))
 
         if min_price:
             queryset = queryset.filter(price__gte=float(min_price))
@@ -68,11 +145,78 @@ class WineViewSet(
             queryset = queryset.filter(capacity__lte=float(max_capacity))
 
         if min_rating:
-            queryset = queryset.filter(avg_rating__gte=float(min_rating))
+            queryset = queryset.filter(average_rating__gte=float(min_rating))
         if max_rating:
-            queryset = queryset.filter(avg_rating__lte=float(max_rating))
+            queryset = queryset.filter(average_rating__lte=float(max_rating))
+
+        if min_vintage:
+            queryset = queryset.filter(vintage_year__gte=self.integer_param("min_vintage", min_vintage))
+        if max_vintage:
+            queryset = queryset.filter(vintage_year__lte=self.integer_param("max_vintage", max_vintage))
+
+        if min_saved:
+            queryset = queryset.filter(saved_count__gte=self.integer_param("min_saved", min_saved))
+
+        return queryset.order_by(*self.ordering_expressions(ordering))
+
+    @staticmethod
+    def integer_param(name, value):
+        """A whole number query parameter, or a 400 naming it."""
+        if not is_ascii_digits(value):
+            raise ValidationError({name: "Must be a whole number."})
+        return int(value)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        return None if page is None else with_saved_flags(page, self.request.user)
+
+    def get_object(self):
+        if self.action != "retrieve":
+            return super().get_object()
+        # concurrent requests for the same wine share one load of it, its blend and its reviews
+        wine = single_flight(
+            f"wine-detail:{request_digest(self.request, self.action, self.kwargs)}", super().get_object
+        )
+        self.check_object_permissions(self.request, wine)
+        return with_saved_flags([wine], self.request.user)[0]
+
+    def ordering_expressions(self, value):
+        """ORDER BY of a whitelisted ``?ordering``, in the column order of its index.
 
-        return queryset.distinct()
+        Wines without a value come last both ways; id keeps pages stable.
+        """
+        if not value:
+            return ["id"]
+        descending = value.startswith("-")
+        field = self.ordering_fields.get(value.removeprefix("-"))
+        if field is None:
+            choices = ", ".join(f"{name}, -{name}" for name in self.ordering_fields)
+            raise ValidationError({"ordering": f"Must be one of: {choices}."})
+
+        nulls_last = True if Wine._meta.get_field(field).null else None
+        if descending:
+            return [F(field).desc(nulls_last=nulls_last), F("id").desc()]
+        return [F(field).asc(nulls_last=nulls_last), F("id").asc()]
+
+    def grape_filters(self, value, match):
+        """Conditions on wines whose blend has any, or all, of the comma separated grapes.
+
+        Each name matches every grape containing it. Membership is checked
+        with semi-joins on the (grape, wine) index of the blend table.
+        """
+        if match not in ("any", "all"):
+            raise ValidationError({"grape_match": 'Must be "any" or "all".'})
+        names = [name for name in value.split(",") if name.strip()]
+        if len(names) > self.max_grape_filters:
+            raise ValidationError({"grape": f"At most {self.max_grape_filters} grapes."})
+
+        id_sets = Grape.objects.ids_matching_each(names, contains=True)
+        if match == "any":
+            id_sets = [[pk for ids in id_sets for pk in ids]] if id_sets else []
+        return [
+            Exists(WineGrape.objects.filter(wine=OuterRef("pk"), grape_id__in=ids))
+            for ids in id_sets
+        ]
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -84,7 +228,7 @@ class WineViewSet(
         if self.action == "upload_image":
             return WineImageSerializer
 
-        if self.action == "add_review":
+        if self.action in ("add_review", "review"):
             return WineReviewSerializer
 
         return WineSerializer
@@ -101,7 +245,8 @@ class WineViewSet(
         serializer = self.get_serializer(wine, data=request.data)
 
         if serializer.is_valid():
-            serializer.save()
+            with metrics.timer("image_processing_seconds"):
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -116,19 +261,48 @@ class WineViewSet(
         """Create a review for a specific wine"""
         wine = self.get_object()
 
-        if WineReview.objects.filter(wine=wine, user=request.user).exists():
-            return Response(
-                {"detail": "You have already reviewed this wine."},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
         serializer = WineReviewSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user, wine=wine)
+            try:
+                with transaction.atomic():
+                    serializer.save(user=request.user, wine=wine)
+            except IntegrityError:
+                return Response(
+                    {"detail": "You have already reviewed this wine."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(
+        methods=["PUT"],
+        detail=True,
+        url_path="review",
+        permission_classes=[IsAuthenticated],
+    )
+    def review(self, request, pk=None):
+        """Create or update the user's review for a specific wine"""
+        wine = self.get_object()
+
+        serializer = WineReviewSerializer(data=request.data)
+        if serializer.is_valid():
+            review, created = WineReview.objects.upsert(
+                wine=wine,
+                user=request.user,
+                rating=serializer.validated_data["rating"],
+                comment=serializer.validated_data.get("comment", ""),
+            )
+            # the upsert bypasses the review signals
+            Wine.objects.refresh_ratings(Wine.objects.filter(pk=wine.pk))
+            bump_catalog_version()
+            return Response(
+                WineReviewSerializer(review).data,
+                status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+            )
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @action(
         methods=["DELETE"],
         detail=True,
@@ -149,6 +323,7 @@ class WineViewSet(
             )
 
         review.delete()
+        bump_catalog_version()
         return Response(
             {"detail": "Your review has been deleted."},
             status=status.HTTP_204_NO_CONTENT,
@@ -158,18 +333,187 @@ class WineViewSet(
     def save(self, request, pk=None):
         """Add wine to user's saved list"""
         wine = self.get_object()
-        user = request.user
-        user.saved_wines.add(wine)
+        if Wine.objects.save_for(wine, request.user):
+            bump_saved_versions([request.user.pk])
         return Response({"status": "Wine added to saved"}, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=["POST"], permission_classes=[IsAuthenticated])
     def unsave(self, request, pk=None):
         """Remove wine from user's saved list"""
         wine = self.get_object()
-        user = request.user
-        user.saved_wines.remove(wine)
+        if Wine.objects.unsave_for(wine, request.user):
+            bump_saved_versions([request.user.pk])
         return Response({"status": "Wine removed from saved"}, status=status.HTTP_200_OK)
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="partial_success",
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                description="Write the valid items even if others fail (default false)",
+            ),
+        ],
+        request=WineSerializer(many=True),
+        responses={200: OpenApiTypes.OBJECT, 201: OpenApiTypes.OBJECT, 207: OpenApiTypes.OBJECT},
+    )
+    @action(
+        methods=["POST", "PATCH"],
+        detail=False,
+        url_path="bulk",
+        permission_classes=[IsAdminUser],
+    )
+    def bulk(self, request):
+        """Create (POST) or partially update by id (PATCH) many wines in one transaction"""
+        items = request.data
+        if not isinstance(items, list) or not 1 <= len(items) <= self.bulk_max_items:
+            return Response(
+                {"detail": f"Send a list of 1 to {self.bulk_max_items} wines."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        partial_success = request.query_params.get("partial_success") in ("1", "true")
+        write = bulk_create_wines if request.method == "POST" else bulk_update_wines
+
+        try:
+            results, written = write(items, partial_success)
+        except IntegrityError:
+            return Response(
+                {"detail": "A wine in the batch was created concurrently, retry the request."},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        if any(result["status"] == "error" for result in results):
+            response_status = status.HTTP_207_MULTI_STATUS if written else status.HTTP_400_BAD_REQUEST
+        elif request.method == "POST":
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_200_OK
+        return Response({"results": results}, status=response_status)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="ids",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description="Comma separated wine ids, at most 200 (e.g., ?ids=3,1,2)",
+            ),
+            OpenApiParameter(
+                name="shape",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                enum=["list", "detail"],
+                description="Return wines as in the list (default) or with reviews as in the detail",
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="batch",
+    )
+    def batch(self, request):
+        """Wines with the given ids in the requested order, plus the ids not found"""
+        return self.dispatch_cached(self.fetch_batch, request)
+
+    def fetch_batch(self, request):
+        shape = request.query_params.get("shape", "list")
+        try:
+            ids = [int(value) for value in request.query_params.get("ids", "").split(",") if value.strip()]
+        except ValueError:
+            return Response(
+                {"detail": "ids must be comma separated integers."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        ids = list(dict.fromkeys(ids))
+
+        if not ids or len(ids) > self.batch_max_ids:
+            return Response(
+                {"detail": f"ids must contain between 1 and {self.batch_max_ids} wine ids."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if shape not in ("list", "detail"):
+            return Response(
+                {"detail": "shape must be list or detail."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = Wine.objects.annotate(is_saved=saved_by(request.user)).filter(pk__in=ids)
+        serializer_class = WineListSerializer
+        if shape == "detail":
+            queryset = queryset.select_related(*DIMENSIONS).prefetch_related(
+                prefetch_blend(),
+                Prefetch("reviews", queryset=WineReview.objects.select_related("user"))
+            )
+            serializer_class = WineDetailSerializer
+
+        wines = {wine.pk: wine for wine in queryset}
+        found = [wines[wine_id] for wine_id in ids if wine_id in wines]
+        return Response(
+            {
+                "results": serializer_class(found, many=True, context=self.get_serializer_context()).data,
+                "missing": [wine_id for wine_id in ids if wine_id not in wines],
+            }
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="field",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                enum=list(autocomplete.FIELDS),
+                required=True,
+                description="Field to complete (e.g., ?field=grape)",
+            ),
+            OpenApiParameter(
+                name="prefix",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=True,
+                description="Typed prefix, case and accent insensitive (e.g., ?prefix=cab)",
+            ),
+            OpenApiParameter(
+                name="limit",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description="Number of suggestions, at most 50 (default 10)",
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT},
+    )
+    @action(
+        methods=["GET"],
+        detail=False,
+        url_path="autocomplete",
+    )
+    def autocomplete(self, request):
+        """Most popular values of a field starting with the given prefix"""
+        field = request.query_params.get("field")
+        prefix = request.query_params.get("prefix", "")
+        limit = request.query_params.get("limit", "10")
+
+        if field not in autocomplete.FIELDS:
+            return Response(
+                {"detail": f"field must be one of: {', '.join(autocomplete.FIELDS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not is_ascii_digits(limit) or not 1 <= int(limit) <= settings.AUTOCOMPLETE["max_results"]:
+            return Response(
+                {"detail": f"limit must be between 1 and {settings.AUTOCOMPLETE['max_results']}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "field": field,
+                "prefix": prefix,
+                "results": autocomplete.search(field, prefix, int(limit)),
+            }
+        )
+
     @extend_schema(
         parameters=[
             OpenApiParameter(
@@ -182,19 +526,38 @@ class WineViewSet(
                 name="wine_type",
                 type=OpenApiTypes.STR,
                 location=OpenApiParameter.QUERY,
-                description="Filter by wine type (e.g., red, white, sparkling)",
+                description="Filter by comma separated wine types (e.g., red,sparkling)",
             ),
             OpenApiParameter(
                 name="grape",
                 type=OpenApiTypes.STR,
                 location=OpenApiParameter.QUERY,
-                description="Filter by grape variety (e.g., cabernet)",
+                description="Filter by comma separated grape varieties, at most 10 (e.g., merlot,cabernet)",
+            ),
+            OpenApiParameter(
+                name="grape_match",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                enum=["any", "all"],
+                description="Blend has any (default) or all of the grapes",
             ),
             OpenApiParameter(
                 name="country",
                 type=OpenApiTypes.STR,
                 location=OpenApiParameter.QUERY,
-                description="Filter by country of origin (e.g., France)",
+                description="Filter by comma separated countries of origin (e.g., France,Italy)",
+            ),
+            OpenApiParameter(
+                name="region",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description="Filter by comma separated regions (e.g., Rioja)",
+            ),
+            OpenApiParameter(
+                name="style",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description="Filter by comma separated styles (e.g., dry,off-dry)",
             ),
             OpenApiParameter(
                 name="min_price",
@@ -244,7 +607,113 @@ class WineViewSet(
                 location=OpenApiParameter.QUERY,
                 description="Maximum average rating (e.g., ?max_rating=5.0)",
             ),
+            OpenApiParameter(
+                name="min_vintage",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description="Minimum vintage year, excludes NV wines (e.g., ?min_vintage=2015)",
+            ),
+            OpenApiParameter(
+                name="max_vintage",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description="Maximum vintage year, excludes NV wines (e.g., ?max_vintage=2020)",
+            ),
+            OpenApiParameter(
+                name="min_saved",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description="Minimum number of users that saved the wine (e.g., ?min_saved=100)",
+            ),
+            OpenApiParameter(
+                name="ordering",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                enum=[
+                    "price", "-price", "abv", "-abv", "vintage", "-vintage", "rating", "-rating",
+                    "saved_count", "-saved_count", "updated_at", "-updated_at",
+                ],
+                description=(
+                    "Sort by price, ABV, vintage year, average rating, number of saves or last update; "
+                    "wines without a value come last (e.g., ?ordering=-rating)"
+                ),
+            ),
         ]
     )
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
+
+
+def parse_cursor(value):
+    """``"<txid>-<id>"`` cursor of the change feed, ``None`` if malformed."""
+    txid, _, change_id = (value or "0-0").partition("-")
+    if not (is_ascii_digits(txid) and is_ascii_digits(change_id)):
+        return None
+    return int(txid), int(change_id)
+
+
+class WineChangeFeedView(APIView):
+    """Wines created, updated or deleted since a cursor, for sync clients"""
+
+    permission_classes = (IsAdminOrIfAuthenticatedReadOnly,)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="since",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                description="Cursor returned by the previous call, omit for a full sync",
+            ),
+            OpenApiParameter(
+                name="limit",
+                type=OpenApiTypes.INT,
+                location=OpenApiParameter.QUERY,
+                description="Number of changes per call, at most 1000 (default 500)",
+            ),
+        ],
+        responses={200: OpenApiTypes.OBJECT, 410: OpenApiTypes.OBJECT},
+    )
+    def get(self, request):
+        config = settings.CHANGE_FEED
+        cursor = parse_cursor(request.query_params.get("since"))
+        limit = request.query_params.get("limit", str(config["page_size"]))
+
+        if cursor is None:
+            return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        if not is_ascii_digits(limit) or not 1 <= int(limit) <= config["max_page_size"]:
+            return Response(
+                {"detail": f"limit must be between 1 and {config['max_page_size']}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if WineChange.objects.is_expired(cursor):
+            return Response(
+                {"detail": "Cursor has expired, sync again without since."},
+                status=status.HTTP_410_GONE,
+            )
+
+        changes, next_cursor, has_more = WineChange.objects.since(cursor, int(limit))
+        # the latest change of a wine wins; deleted wines become tombstones
+        latest = {change.wine_id: change for change in changes}
+        wines = Wine.objects.select_related(*DIMENSIONS).prefetch_related(prefetch_blend()).filter(
+            pk__in=[wine_id for wine_id, change in latest.items() if change.action != WineChange.DELETED]
+        ).order_by()
+        serialized = {
+            data["id"]: data
+            for data in WineChangeSerializer(wines, many=True, context={"request": request}).data
+        }
+        results = []
+        for wine_id, change in sorted(latest.items(), key=lambda item: (item[1].txid, item[1].id)):
+            data = serialized.get(wine_id)
+            if data is None:
+                results.append({"id": wine_id, "change": WineChange.DELETED, "wine": None})
+            else:
+                results.append({"id": wine_id, "change": change.action, "wine": data})
+
+        return Response(
+            {
+                "results": results,
+                "cursor": "-".join(map(str, next_cursor)),
+                "has_more": has_more,
+            }
+        )